@@ -0,0 +1,779 @@
+"""
+Helpers shared by the Cedar app and agent loop tests
+"""
+
+import ast
+import atexit
+import gzip
+import hashlib
+import json
+import operator
+import os
+import queue
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from contextlib import nullcontext
+from pathlib import Path
+from typing import List, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    from filelock import FileLock
+except ImportError:
+    FileLock = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Stream uploads straight from disk when requests-toolbelt is available;
+# plain requests builds the whole multipart body in memory first.
+try:
+    from requests_toolbelt.multipart.encoder import MultipartEncoder, MultipartEncoderMonitor
+except ImportError:
+    MultipartEncoder = None
+
+# orjson parses and pretty-prints much faster; fall back to the stdlib when it's absent.
+try:
+    import orjson
+
+    json_loads = orjson.loads
+
+    def json_pretty(obj):
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+except ImportError:
+    json_loads = json.loads
+
+    def json_pretty(obj):
+        return json.dumps(obj, indent=2)
+
+# Lines the app logs around its startup API key check
+API_KEY_REQUIRED = "API key required"
+API_KEY_VALID = "API key validation passed"
+KEY_DEFERRED = "Backend will fetch API key when needed"
+
+# One pass per line finds whichever marker is present
+KEY_MARKERS = re.compile("|".join(map(re.escape, (API_KEY_REQUIRED, API_KEY_VALID, KEY_DEFERRED))))
+
+# Results of passing deterministic tests, keyed by what they depend on
+MEMO_DIR = Path.home() / ".cache" / "cedar" / "memo"
+MEMO_TTL = 24 * 3600
+
+# OpenAI key from the Render relay, shared by the agent scripts between runs.
+# Callers that name their relay and token get a file of their own, so pointing
+# at another relay or rotating the token forces a refetch.
+API_KEY_CACHE = Path.home() / ".cache" / "cedar" / "api_key.json"
+API_KEY_TTL = 3600
+
+
+# Outputs of deterministic Julia snippets, keyed by a hash of the code
+JULIA_RESULTS_DIR = Path.home() / ".cache" / "cedar" / "julia-results"
+
+# Calls whose output can change between runs, so their results aren't reused
+JULIA_NONDETERMINISTIC = re.compile(
+    r"\b(rand\w*|shuffle!?|time\w*|now|today|Dates|sleep|ENV|run|download|"
+    r"open|read\w*|write|isfile|isdir|mkdir|mkpath|rm|cp|mv|cd|pwd|include\w*)\b|@\w*time"
+)
+
+
+# Client-side OpenAI budget, so concurrent callers pace themselves instead of
+# tripping 429s and backing off
+OPENAI_MAX_RPM = int(os.environ.get("CEDAR_OPENAI_MAX_RPM", 500))
+OPENAI_MAX_TPM = int(os.environ.get("CEDAR_OPENAI_MAX_TPM", 200_000))
+
+
+# Prebuilt Julia image for agent-generated code (scripts/build_agent_sysimage.jl)
+REPO_ROOT = Path(__file__).resolve().parent
+AGENT_SYSIMAGE = Path(os.environ.get("CEDAR_AGENT_SYSIMAGE") or REPO_ROOT / "target" / "julia" / "cedar_sysimage.so")
+
+# notebook_server for the upload tests. CEDAR_SERVER_BIN points at a prebuilt
+# server (e.g. from a CI cache) and skips cargo
+SERVER_BIN = Path(os.environ.get("CEDAR_SERVER_BIN") or
+                  Path(os.environ.get("CARGO_TARGET_DIR", REPO_ROOT / "target")) / "release" / "notebook_server")
+# What notebook_server logs once it is accepting connections
+READY_LINE = re.compile(r"listening on|Server.*running")
+
+# CEDAR_GZIP_UPLOAD=1 gzips the whole multipart body (Content-Encoding: gzip).
+# Only for servers that decode request bodies, so it is opt-in.
+GZIP_UPLOAD = os.environ.get("CEDAR_GZIP_UPLOAD") == "1"
+
+
+@lru_cache(maxsize=32)
+def app_exists(path):
+    """Cached os.path.exists for app binaries that don't appear mid-run"""
+    return os.path.exists(path)
+
+
+def stream_command(cmd, cwd=None, env=None, tail_lines=500):
+    """Run cmd, echoing its output live and keeping only the last tail_lines
+
+    Stops the command at the first line starting with "error" (cargo/rustc
+    errors), since the rest of a failed build is rarely worth waiting for.
+    Returns (returncode, tail) where tail is the kept output as one string.
+    """
+    tail = deque(maxlen=tail_lines)
+    process = subprocess.Popen(
+        cmd,
+        cwd=cwd,
+        env=env,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+        text=True,
+        bufsize=1
+    )
+    for line in process.stdout:
+        tail.append(line)
+        print(line, end="")
+        if line.startswith("error"):
+            process.kill()
+            break
+    process.stdout.close()
+    process.wait()
+    return process.returncode, "".join(tail)
+
+
+def watch_output(proc, markers, timeout, tail_lines=2000):
+    """Drain proc's stdout and stderr until a marker shows up or it exits
+
+    Each pipe is read on its own daemon thread into a bounded tail, so a
+    chatty process neither fills its pipe buffer nor grows our memory.
+    Returns (readers, tails, seen): the reader threads, a dict of
+    "stdout"/"stderr" deques holding the last tail_lines lines, and the set
+    of markers matched so far. Readers keep draining until the pipes close.
+    """
+    ready = threading.Event()
+    closed = []
+    seen = set()
+    tails = {"stdout": deque(maxlen=tail_lines), "stderr": deque(maxlen=tail_lines)}
+
+    def reader(pipe, tail):
+        for line in pipe:
+            tail.append(line)
+            match = markers.search(line)
+            if match:
+                seen.add(match.group(0))
+                ready.set()
+        closed.append(pipe)
+        ready.set()
+
+    readers = [
+        threading.Thread(target=reader, args=(proc.stdout, tails["stdout"]), daemon=True),
+        threading.Thread(target=reader, args=(proc.stderr, tails["stderr"]), daemon=True),
+    ]
+    for thread in readers:
+        thread.start()
+    ready.wait(timeout)
+    if closed:
+        # A closed pipe means the process is exiting; let poll() see it
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            pass
+    return readers, tails, seen
+
+
+def source_fingerprint(*paths):
+    """Hash of the committed git trees at paths
+
+    Returns None when any of them has uncommitted changes (or git is
+    unavailable), since HEAD then doesn't describe what would be built.
+    """
+    try:
+        dirty = subprocess.run(
+            ["git", "status", "--porcelain", "--", *paths],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+        if dirty:
+            return None
+        trees = subprocess.check_output(["git", "rev-parse", *(f"HEAD:{p}" for p in paths)])
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return hashlib.sha256(trees).hexdigest()
+
+
+def memo_passed(key):
+    """True if a pass for key was recorded within MEMO_TTL
+
+    Set CEDAR_TEST_FORCE=1 to ignore recorded passes.
+    """
+    if os.environ.get("CEDAR_TEST_FORCE") == "1":
+        return False
+    path = MEMO_DIR / f"{key}.json"
+    if not path.exists() or time.time() - path.stat().st_mtime > MEMO_TTL:
+        return False
+    return json.loads(path.read_text()).get("ok") is True
+
+
+def memo_record_pass(key):
+    """Record that the test identified by key passed"""
+    MEMO_DIR.mkdir(parents=True, exist_ok=True)
+    (MEMO_DIR / f"{key}.json").write_text(json.dumps({"ok": True, "at": time.time()}))
+
+
+def _api_key_cache(relay=None, token=None):
+    if relay is None and token is None:
+        return API_KEY_CACHE
+    # "https://host/" and "host" name the same relay
+    relay = relay and relay.split("://")[-1].rstrip("/")
+    tag = hashlib.blake2b(f"{relay}\0{token}".encode(), digest_size=6).hexdigest()
+    return API_KEY_CACHE.with_name(f"api_key-{tag}.json")
+
+
+def _read_cached_key(path):
+    try:
+        cached = json.loads(path.read_text())
+        if time.time() < cached["fetched_at"] + cached["ttl_s"] - 60:
+            return cached["key"]
+    except (OSError, ValueError, KeyError, TypeError):
+        pass
+    return None
+
+
+def cached_api_key(fetch, relay=None, token=None, refresh=False):
+    """Return the cached key while it has over a minute left, else fetch() and cache it
+
+    relay and token (the relay host and app token fetch() uses) select the
+    cache file, so keys from different relays or tokens are never mixed up.
+    refresh=True ignores the cached key and always fetches a new one.
+    The refetch runs under a file lock (when filelock is installed) so
+    concurrent runs make one request to the relay between them.
+    """
+    path = _api_key_cache(relay, token)
+    key = None if refresh else _read_cached_key(path)
+    if key:
+        return key
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    lock = FileLock(f"{path}.lock") if FileLock else nullcontext()
+    with lock:
+        # Another run may have refreshed it while we waited for the lock
+        key = None if refresh else _read_cached_key(path)
+        if key:
+            return key
+        key = fetch()
+        if key:
+            fd, tmp = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "w") as f:
+                json.dump({"key": key, "fetched_at": time.time(), "ttl_s": API_KEY_TTL}, f)
+            os.chmod(tmp, 0o600)
+            os.replace(tmp, path)
+    return key
+
+
+class RateLimiter:
+    """Requests and tokens per minute, refilled continuously and shared across threads
+
+    acquire() blocks until both budgets can cover the call, the same
+    accounting as OpenAI's api_request_parallel_processor.py cookbook
+    script, with the refill computed on demand rather than by a loop.
+    """
+
+    def __init__(self, max_requests_per_minute, max_tokens_per_minute):
+        self.max_requests = max_requests_per_minute
+        self.max_tokens = max_tokens_per_minute
+        self.requests = float(max_requests_per_minute)
+        self.tokens = float(max_tokens_per_minute)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed, self.updated = now - self.updated, now
+        self.requests = min(self.max_requests, self.requests + elapsed * self.max_requests / 60)
+        self.tokens = min(self.max_tokens, self.tokens + elapsed * self.max_tokens / 60)
+
+    def acquire(self, tokens):
+        tokens = min(tokens, self.max_tokens)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.requests >= 1 and self.tokens >= tokens:
+                    self.requests -= 1
+                    self.tokens -= tokens
+                    return
+                wait = max((1 - self.requests) * 60 / self.max_requests,
+                           (tokens - self.tokens) * 60 / self.max_tokens)
+            time.sleep(wait)
+
+
+@lru_cache(maxsize=1)
+def openai_limiter():
+    """The process-wide RateLimiter for OpenAI calls"""
+    return RateLimiter(OPENAI_MAX_RPM, OPENAI_MAX_TPM)
+
+
+@lru_cache(maxsize=1)
+def _token_encoding():
+    try:
+        import tiktoken
+        return tiktoken.encoding_for_model("gpt-4o-mini")
+    except Exception:
+        # Not installed, or the encoding can't be downloaded; estimate instead
+        return None
+
+
+def estimate_tokens(request_body):
+    """Prompt tokens plus the completion allowance a chat request can use"""
+    text = "".join(str(m.get("content") or "") for m in request_body.get("messages", []))
+    encoding = _token_encoding()
+    prompt_tokens = len(encoding.encode(text)) if encoding else len(text) // 4
+    return prompt_tokens + request_body.get("max_tokens", 0)
+
+
+@lru_cache(maxsize=256)
+def _stored_julia_result(key):
+    # A miss raises, and lru_cache only remembers hits
+    return json.loads((JULIA_RESULTS_DIR / f"{key}.json").read_text())
+
+
+def run_julia_cached(code, timeout=5, run=None):
+    """Run Julia code, reusing the stored output of an earlier successful run
+
+    run(code, timeout) does the actual work and returns a CompletedProcess;
+    by default a fresh julia -e. Only runs that exit 0 and whose code has
+    no randomness, clock or I/O calls are stored.
+    """
+    key = hashlib.blake2b(code.encode(), digest_size=16).hexdigest()
+    try:
+        stored = _stored_julia_result(key)
+        return subprocess.CompletedProcess(["julia", "-e", code], 0, stored["stdout"], stored["stderr"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    if run is None:
+        def run(code, timeout):
+            return subprocess.run(julia_command("-e", code), capture_output=True, text=True, timeout=timeout)
+    result = run(code, timeout)
+
+    if result.returncode == 0 and not JULIA_NONDETERMINISTIC.search(code):
+        JULIA_RESULTS_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=JULIA_RESULTS_DIR)
+        with os.fdopen(fd, "w") as f:
+            json.dump({"stdout": result.stdout, "stderr": result.stderr}, f)
+        os.replace(tmp, JULIA_RESULTS_DIR / f"{key}.json")
+    return result
+
+
+# Chat completion bodies are checked against these types and encoded in one C
+# pass when msgspec is installed; otherwise they go out as plain JSON
+if msgspec is not None:
+    class Message(msgspec.Struct, omit_defaults=True):
+        role: str
+        content: Optional[str] = None
+        tool_calls: Optional[list] = None
+        tool_call_id: Optional[str] = None
+
+    class ChatRequest(msgspec.Struct, omit_defaults=True):
+        model: str
+        messages: List[Message]
+        temperature: float
+        max_tokens: int
+        response_format: Optional[dict] = None
+        tools: Optional[list] = None
+        tool_choice: Optional[str] = None
+        stream: Optional[bool] = None
+
+    _CHAT_ENCODER = msgspec.json.Encoder()
+
+    def encode_chat_request(body):
+        """JSON bytes for a chat completion body, rejecting malformed fields"""
+        return _CHAT_ENCODER.encode(msgspec.convert(body, ChatRequest))
+else:
+    try:
+        import orjson
+
+        def encode_chat_request(body):
+            """JSON bytes for a chat completion body"""
+            return orjson.dumps(body)
+    except ImportError:
+        def encode_chat_request(body):
+            """JSON bytes for a chat completion body"""
+            return json.dumps(body).encode()
+
+
+def julia_command(*args):
+    """julia with no startup file, on the agent sysimage when it has been built"""
+    cmd = ["julia", "--startup-file=no"]
+    if AGENT_SYSIMAGE.exists():
+        cmd.append(f"--sysimage={AGENT_SYSIMAGE}")
+    return cmd + list(args)
+
+
+def build_agent_sysimage():
+    """Build the agent sysimage if it is missing; True when it is ready to use
+
+    Concurrent callers (xdist workers) build it once between them under a
+    file lock, into a temp file renamed into place. A failed build leaves a
+    .failed marker that stops later calls from retrying until the build
+    script changes or the marker is deleted.
+    """
+    if AGENT_SYSIMAGE.exists():
+        return True
+    script = REPO_ROOT / "scripts" / "build_agent_sysimage.jl"
+    failed = AGENT_SYSIMAGE.with_name(AGENT_SYSIMAGE.name + ".failed")
+    AGENT_SYSIMAGE.parent.mkdir(parents=True, exist_ok=True)
+    lock = FileLock(f"{AGENT_SYSIMAGE}.lock") if FileLock else nullcontext()
+    with lock:
+        # Another worker may have built it, or failed to, while we waited
+        if AGENT_SYSIMAGE.exists():
+            return True
+        if failed.exists() and failed.stat().st_mtime >= script.stat().st_mtime:
+            return False
+        print("\n🔧 Building Julia agent sysimage (one-off, takes a few minutes)...")
+        tmp = AGENT_SYSIMAGE.with_name(f"{AGENT_SYSIMAGE.stem}.{os.getpid()}.tmp{AGENT_SYSIMAGE.suffix}")
+        result = subprocess.run(["julia", str(script), str(tmp)], capture_output=True, text=True)
+        if result.returncode != 0:
+            tmp.unlink(missing_ok=True)
+            failed.write_text(result.stderr[-2000:])
+            print("   ⚠️  Sysimage build failed, Julia will start from the default image")
+            print(f"   Delete {failed} to retry")
+            print(result.stderr[-2000:])
+            return False
+        failed.unlink(missing_ok=True)
+        os.replace(tmp, AGENT_SYSIMAGE)
+    return True
+
+
+# println(<pure arithmetic>) snippets, whose output is known without running Julia
+_JULIA_ARITHMETIC = re.compile(r"^\s*println\(([\d\s+\-*/().]+)\)\s*;?\s*$")
+_ARITHMETIC_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul, ast.Div: operator.truediv,
+    ast.UAdd: operator.pos, ast.USub: operator.neg,
+}
+
+
+def _eval_arithmetic(node):
+    if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+        return node.value
+    if isinstance(node, ast.BinOp):
+        return _ARITHMETIC_OPS[type(node.op)](_eval_arithmetic(node.left), _eval_arithmetic(node.right))
+    if isinstance(node, ast.UnaryOp):
+        return _ARITHMETIC_OPS[type(node.op)](_eval_arithmetic(node.operand))
+    raise TypeError(f"not arithmetic: {ast.dump(node)}")
+
+
+def predict_julia_output(code):
+    """What Julia prints for println(<pure arithmetic>), or None if it can't be predicted
+
+    A guess for speculative work only: callers must still compare it with
+    the real output, e.g. float formatting differs for very large values.
+    """
+    match = _JULIA_ARITHMETIC.match(code)
+    if not match:
+        return None
+    try:
+        value = _eval_arithmetic(ast.parse(match.group(1).strip(), mode="eval").body)
+    except (SyntaxError, KeyError, TypeError, ZeroDivisionError, RecursionError):
+        return None
+    # Julia's Int64 wraps around where Python's int keeps growing
+    if isinstance(value, int) and not -2**63 <= value < 2**63:
+        return None
+    return f"{value}\n"
+
+
+# Julia side of JuliaDaemon: read length-prefixed code blocks from stdin, run
+# each in Main, then mark the end of its output on both streams
+_JULIA_DRIVER = """
+for pkg in filter(!isempty, split(get(ENV, "CEDAR_JULIA_PRELOAD", ""), ","))
+    try
+        @eval using $(Symbol(pkg))
+    catch
+    end
+end
+while !eof(stdin)
+    code = String(read(stdin, parse(Int, readline(stdin))))
+    status = 0
+    try
+        include_string(Main, code)
+    catch err
+        status = 1
+        Base.display_error(stderr, err, catch_backtrace())
+    end
+    println(stdout, "\\n__CEDAR_DONE__ ", status)
+    println(stderr, "\\n__CEDAR_DONE__")
+    flush(stdout)
+    flush(stderr)
+end
+"""
+
+
+class JuliaDaemon:
+    """One long-lived Julia process that runs code blocks on request
+
+    Starting Julia and compiling Base for a one-line snippet costs far more
+    than running it, so every block after the first reuses the warm process.
+    Packages named in preload are loaded once at startup.
+    """
+
+    SENTINEL = "__CEDAR_DONE__"
+
+    def __init__(self, preload=()):
+        self.preload = preload
+        self.proc = None
+        self.lock = threading.Lock()
+
+    def _start(self):
+        env = dict(os.environ, CEDAR_JULIA_PRELOAD=",".join(self.preload))
+        self.proc = subprocess.Popen(
+            julia_command("-e", _JULIA_DRIVER),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            env=env
+        )
+        self.lines = {"stdout": queue.Queue(), "stderr": queue.Queue()}
+        for name in ("stdout", "stderr"):
+            threading.Thread(
+                target=self._pump, args=(getattr(self.proc, name), self.lines[name]), daemon=True
+            ).start()
+
+    @staticmethod
+    def _pump(pipe, lines):
+        for line in pipe:
+            lines.put(line.decode("utf-8", errors="replace"))
+        lines.put(None)
+
+    def _collect(self, name, deadline):
+        """Lines of one stream up to the sentinel; returns (text, sentinel line)"""
+        out = []
+        while True:
+            line = self.lines[name].get(timeout=max(0, deadline - time.monotonic()))
+            if line is None:
+                raise EOFError("Julia daemon exited")
+            if line.startswith(self.SENTINEL):
+                # Drop the newline the driver adds in case the block left a partial line
+                return "".join(out)[:-1], line
+            out.append(line)
+
+    def run(self, code, timeout=10):
+        """Run code and return a CompletedProcess with its stdout and stderr
+
+        Raises subprocess.TimeoutExpired if the block overruns and
+        RuntimeError if the Julia process dies mid-block; either way Julia is
+        restarted on the next call. FileNotFoundError if Julia is missing.
+        """
+        with self.lock:
+            if self.proc is None or self.proc.poll() is not None:
+                self._start()
+            data = code.encode()
+            deadline = time.monotonic() + timeout
+            try:
+                self.proc.stdin.write(b"%d\n%s" % (len(data), data))
+                self.proc.stdin.flush()
+                stdout, done = self._collect("stdout", deadline)
+                stderr, _ = self._collect("stderr", deadline)
+            except queue.Empty:
+                self.close()
+                raise subprocess.TimeoutExpired("julia", timeout)
+            except (EOFError, BrokenPipeError) as e:
+                self.close()
+                raise RuntimeError("julia daemon exited") from e
+            returncode = int(done.split()[1])
+            return subprocess.CompletedProcess(["julia", "-e", code], returncode, stdout, stderr)
+
+    def close(self):
+        if self.proc is not None and self.proc.poll() is None:
+            self.proc.kill()
+            self.proc.wait()
+        self.proc = None
+
+
+class JuliaDaemonPool:
+    """Up to size JuliaDaemons, so concurrent blocks run side by side
+
+    Each daemon starts on its first block, so a run that only ever has one
+    block in flight pays for one Julia startup.
+    """
+
+    def __init__(self, size, preload=()):
+        self.daemons = [JuliaDaemon(preload) for _ in range(size)]
+        self.idle = queue.Queue()
+        for daemon in self.daemons:
+            self.idle.put(daemon)
+
+    def run(self, code, timeout=10):
+        """JuliaDaemon.run on whichever daemon is free"""
+        daemon = self.idle.get()
+        try:
+            return daemon.run(code, timeout)
+        finally:
+            self.idle.put(daemon)
+
+    def close(self):
+        for daemon in self.daemons:
+            daemon.close()
+
+
+# Warm Julia processes kept for agent tool calls that run at the same time
+JULIA_WORKERS = int(os.environ.get("CEDAR_JULIA_WORKERS", 4))
+
+
+@lru_cache(maxsize=1)
+def julia_daemon():
+    """The process-wide JuliaDaemonPool, shut down at exit"""
+    pool = JuliaDaemonPool(JULIA_WORKERS)
+    atexit.register(pool.close)
+    return pool
+
+
+# A POST is only re-sent on these statuses: the server turned it away without
+# running it, so a retry can't bill a chat completion twice
+POST_RETRY_STATUSES = frozenset({429, 503})
+
+
+class _SafeRetry(Retry):
+    """Retry that re-sends POSTs only on POST_RETRY_STATUSES"""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == "POST":
+            return status_code in POST_RETRY_STATUSES
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def make_session(retry=True, pool_maxsize=10):
+    """A pooled keep-alive requests session, closed at exit
+
+    With retry, transient 429/5xx responses are retried with backoff,
+    honouring Retry-After (POSTs only on 429/503), and the last response is
+    handed back instead of raised so the caller can report its status.
+    """
+    session = requests.Session()
+    max_retries = _SafeRetry(
+        total=4,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        respect_retry_after_header=True,
+        raise_on_status=False
+    ) if retry else 0
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=max_retries)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    atexit.register(session.close)
+    return session
+
+
+def post_gzipped(session, url, files, headers, timeout):
+    """POST files as a gzip-compressed multipart body"""
+    prepared = requests.Request('POST', url, files=files).prepare()
+    headers['Content-Type'] = prepared.headers['Content-Type']
+    headers['Content-Encoding'] = 'gzip'
+    return session.post(url, data=gzip.compress(prepared.body, compresslevel=1), headers=headers, timeout=timeout)
+
+
+def post_multipart(session, url, fields, headers=None, timeout=60, indent=""):
+    """POST fields as multipart/form-data, streaming them with a progress line when possible
+
+    fields takes the same dict or list of (name, (filename, fileobj, type))
+    that requests' files= does. With GZIP_UPLOAD the body is compressed
+    instead, and without requests-toolbelt it is built in memory.
+    """
+    headers = dict(headers or {})
+    if GZIP_UPLOAD:
+        return post_gzipped(session, url, fields, headers, timeout)
+    if MultipartEncoder is None:
+        return session.post(url, files=fields, headers=headers, timeout=timeout)
+
+    def progress(monitor):
+        done = monitor.bytes_read >= monitor.len
+        print(f"\r{indent}📤 Sent {monitor.bytes_read / 1024:.1f}/{monitor.len / 1024:.1f} KB",
+              end="\n" if done else "", flush=True)
+
+    monitor = MultipartEncoderMonitor(MultipartEncoder(fields=fields), progress)
+    headers['Content-Type'] = monitor.content_type
+    return session.post(url, data=monitor, headers=headers, timeout=timeout)
+
+
+def server_binary_stale():
+    """True when the server binary is missing or older than any crate source"""
+    try:
+        built = SERVER_BIN.stat().st_mtime
+    except FileNotFoundError:
+        return True
+    crates = REPO_ROOT / "crates"
+    sources = [REPO_ROOT / "Cargo.lock", *crates.rglob("*.rs"), *crates.rglob("Cargo.toml")]
+    # Cargo.lock is gitignored, so a fresh checkout may not have one yet
+    return any(p.stat().st_mtime > built for p in sources if p.exists())
+
+
+def cargo_build_env():
+    """Build environment using sccache and the mold linker when they're installed
+
+    Without sccache, incremental compilation stays on. Values already set
+    in the environment are kept.
+    """
+    env = os.environ.copy()
+    if shutil.which("sccache"):
+        # sccache can't cache incremental builds, so it replaces incremental
+        env.setdefault("RUSTC_WRAPPER", "sccache")
+        env.setdefault("CARGO_INCREMENTAL", "0")
+    else:
+        env.setdefault("CARGO_INCREMENTAL", "1")
+    if shutil.which("mold") and sys.platform.startswith("linux"):
+        env.setdefault("CARGO_BUILD_RUSTFLAGS", "-C link-arg=-fuse-ld=mold")
+    return env
+
+
+def build_server():
+    """Build notebook_server only when its sources changed since the last build"""
+    if os.environ.get("CEDAR_SERVER_BIN"):
+        return SERVER_BIN.exists()
+    if not server_binary_stale():
+        return True
+    cmd = ["cargo", "build", "--release", "--bin", "notebook_server", "--message-format=short",
+           # Pin the target dir so the binary lands at SERVER_BIN even if
+           # CARGO_TARGET_DIR changes after import (conftest's cargo_env does)
+           "--target-dir", str(SERVER_BIN.parent.parent)]
+    if os.environ.get("CEDAR_CARGO_OFFLINE") == "1":
+        cmd += ["--offline", "--frozen"]
+    result = subprocess.run(
+        cmd,
+        cwd=REPO_ROOT,
+        env=cargo_build_env(),
+        capture_output=True,
+        text=True
+    )
+    if result.returncode != 0:
+        print("   ⚠️  Building notebook_server failed")
+        print(result.stderr[-2000:])
+    return result.returncode == 0
+
+
+def port_open(host, port):
+    """True once something accepts TCP connections on host:port"""
+    try:
+        socket.create_connection((host, port), timeout=0.1).close()
+        return True
+    except OSError:
+        return False
+
+
+def wait_until_healthy(session, base_url, server_proc, ready_evt, timeout=30):
+    """Poll the server's port cheaply every 20ms, then confirm with one /health GET"""
+    url = urlsplit(base_url)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline and server_proc.poll() is None:
+        if port_open(url.hostname, url.port):
+            try:
+                if session.get(f"{base_url}/health", timeout=1).status_code == 200:
+                    return True
+            except requests.exceptions.RequestException:
+                pass
+        # Wake early on the server's ready line; once it's seen, plain pacing
+        if ready_evt.is_set():
+            time.sleep(0.02)
+        else:
+            ready_evt.wait(0.02)
+    return False
@@ -0,0 +1,62 @@
+"""
+Shared pytest fixtures for the Cedar app and agent loop tests
+"""
+
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+import requests
+
+from cedar_test_utils import AGENT_SYSIMAGE, build_agent_sysimage, cached_api_key, cargo_build_env
+
+REPO_ROOT = Path(__file__).resolve().parent
+RENDER_SERVER = "https://cedar-notebook.onrender.com"
+APP_TOKEN = "403-298-09345-023495"
+
+
+@pytest.fixture(scope="session", autouse=True)
+def cargo_env():
+    """Point every cargo build in the suite at one shared, cached target dir"""
+    os.environ.setdefault("CARGO_TARGET_DIR", str(REPO_ROOT / "target" / "cedar-tests"))
+    # Same sccache/mold settings build_server() uses; already-set values win
+    os.environ.update(cargo_build_env())
+
+
+@pytest.fixture(scope="session")
+def agent_sysimage():
+    """Julia sysimage for agent-generated code, for tests that run Julia
+
+    The build takes minutes, longer than the suite's --timeout, so it only
+    runs with CEDAR_BUILD_SYSIMAGE=1; otherwise an existing image is used.
+    Returns the image path, or None when Julia starts from its default image.
+    """
+    if not shutil.which("julia"):
+        pytest.skip("julia is not installed")
+    if AGENT_SYSIMAGE.exists() or (os.environ.get("CEDAR_BUILD_SYSIMAGE") and build_agent_sysimage()):
+        return AGENT_SYSIMAGE
+    return None
+
+
+@pytest.fixture(scope="session")
+def api_key():
+    """OpenAI API key fetched from the Render key server, cached for an hour
+
+    The key is shared on disk with every xdist worker, the next run and the
+    agent scripts, so they all skip the round trip to the key server.
+    """
+    if os.environ.get("OPENAI_API_KEY"):
+        return os.environ["OPENAI_API_KEY"]
+
+    def fetch():
+        response = requests.get(
+            f"{RENDER_SERVER}/v1/key",
+            headers={"x-app-token": APP_TOKEN},
+            # (connect, read): give up quickly if the key server is unreachable
+            timeout=(3, 10)
+        )
+        assert response.status_code == 200, f"❌ Failed to fetch key: {response.text}"
+        return response.json()["openai_api_key"]
+
+    return cached_api_key(fetch, RENDER_SERVER, APP_TOKEN)
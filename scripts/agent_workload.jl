@@ -0,0 +1,20 @@
+# The kind of code the agent writes for run_julia: arithmetic, summary
+# statistics and reading a small CSV into a DataFrame.
+using CSV, DataFrames, Statistics
+
+println(2 + 2)
+xs = [1.5, 2.5, 3.5, 4.5]
+println(sum(xs), " ", mean(xs), " ", median(xs), " ", std(xs))
+
+mktempdir() do dir
+    csv_path = joinpath(dir, "sample.csv")
+    write(csv_path, """
+    product_id,product_name,category,price,stock_quantity
+    P001,Laptop Pro 15,Electronics,1299.99,45
+    P002,Wireless Mouse,Accessories,29.99,150
+    P003,Desk Lamp LED,Office,34.99,100
+    """)
+    df = CSV.read(csv_path, DataFrame)
+    println(describe(df))
+    println(combine(groupby(df, :category), :price => mean => :avg_price))
+end
@@ -0,0 +1,20 @@
+# Build a Julia sysimage with the packages agent-generated code reaches for,
+# so each run_julia call starts with them loaded and compiled.
+#
+#   julia scripts/build_agent_sysimage.jl [output path, default cedar_sysimage.so]
+#
+# The agent test scripts pick it up from target/julia/cedar_sysimage.so, or
+# from CEDAR_AGENT_SYSIMAGE=<path>.
+if Base.find_package("PackageCompiler") === nothing
+    println(stderr, "PackageCompiler is not installed: julia -e 'using Pkg; Pkg.add(\"PackageCompiler\")'")
+    exit(2)
+end
+
+using PackageCompiler
+
+sysimage_path = isempty(ARGS) ? "cedar_sysimage.so" : ARGS[1]
+mkpath(dirname(abspath(sysimage_path)))
+
+create_sysimage([:CSV, :DataFrames, :Statistics];
+                sysimage_path=sysimage_path,
+                precompile_execution_file=joinpath(@__DIR__, "agent_workload.jl"))
@@ -0,0 +1,14 @@
+# Build a Julia sysimage with the packages the dataset conversion step uses,
+# so the server's julia calls skip package loading and JIT compilation.
+#
+#   julia scripts/build_sysimage.jl [output path, default sysimage.so]
+#
+# Point the server at the result with CEDAR_JULIA_SYSIMAGE=<path>.
+using PackageCompiler
+
+sysimage_path = isempty(ARGS) ? "sysimage.so" : ARGS[1]
+mkpath(dirname(abspath(sysimage_path)))
+
+create_sysimage([:CSV, :DataFrames, :Parquet];
+                sysimage_path=sysimage_path,
+                precompile_execution_file=joinpath(@__DIR__, "precompile_workload.jl"))
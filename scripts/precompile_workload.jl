@@ -0,0 +1,17 @@
+# Representative CSV -> Parquet conversion, run while building the sysimage
+# so the methods it touches are compiled ahead of time.
+using CSV, DataFrames, Parquet
+
+mktempdir() do dir
+    csv_path = joinpath(dir, "sample.csv")
+    write(csv_path, """
+    product_id,product_name,category,price,stock_quantity,last_updated,rating
+    P001,Laptop Pro 15,Electronics,1299.99,45,2024-01-15,4.5
+    P002,Wireless Mouse,Accessories,29.99,150,2024-01-14,4.2
+    P003,Desk Lamp LED,Office,34.99,100,2024-01-15,4.4
+    """)
+    df = CSV.read(csv_path, DataFrame)
+    parquet_path = joinpath(dir, "sample.parquet")
+    write_parquet(parquet_path, df)
+    DataFrame(read_parquet(parquet_path))
+end
@@ -1,14 +1,18 @@
-#\!/usr/bin/env python3
+#!/usr/bin/env python3
 """
 Test that the agent loop works through the Rust backend
 """
 
-import json
-import subprocess
 import sys
 import os
+import hashlib
 
-def test_agent_query():
+import pytest
+
+from cedar_test_utils import memo_passed, memo_record_pass, source_fingerprint, stream_command
+
+@pytest.mark.timeout(900)
+def test_agent_query(api_key):
     """Test a simple query through the Rust backend"""
     
     print("\n" + "="*80)
@@ -19,24 +23,15 @@ def test_agent_query():
     env = os.environ.copy()
     env["CEDAR_KEY_URL"] = "https://cedar-notebook.onrender.com"
     env["APP_SHARED_TOKEN"] = "403-298-09345-023495"
+    # Pre-fetched by the session fixture so the backend skips the key server
+    env["OPENAI_API_KEY"] = api_key
     
-    print("\n[1] Testing through Tauri command...")
-    
-    # Run the app binary directly with a test command
-    app_path = "target/release/app"
-    
-    if not os.path.exists(app_path):
-        print(f"❌ App not found at {app_path}")
-        print("   Building app first...")
-        subprocess.run(["cargo", "build", "--release", "-p", "app"])
-    
-    # The Tauri app needs to be tested differently - let's test the backend directly
-    print("\n[2] Testing backend directly...")
+    print("\n[1] Testing backend directly...")
     
     # Create simple Rust test inline
     test_code = '''
 fn main() {
-    println\!("Testing Cedar backend agent loop...");
+    println!("Testing Cedar backend agent loop...");
     
     // Set environment
     std::env::set_var("CEDAR_KEY_URL", "https://cedar-notebook.onrender.com");
@@ -46,21 +41,21 @@ fn main() {
     let runtime = tokio::runtime::Runtime::new().unwrap();
     
     runtime.block_on(async {
-        println\!("[TEST] Creating backend...");
+        println!("[TEST] Creating backend...");
         let backend = notebook_server::initialize_native().unwrap();
         
-        println\!("[TEST] Submitting query: 2+2=");
+        println!("[TEST] Submitting query: 2+2=");
         match backend.submit_query("2+2=").await {
             Ok(result) => {
-                println\!("[SUCCESS] Result: {}", result);
+                println!("[SUCCESS] Result: {}", result);
                 if result.contains("4") {
-                    println\!("✅ Correct answer received\!");
+                    println!("✅ Correct answer received!");
                 } else {
-                    println\!("⚠️ Answer doesn't contain '4'");
+                    println!("⚠️ Answer doesn't contain '4'");
                 }
             }
             Err(e) => {
-                eprintln\!("[ERROR] Query failed: {}", e);
+                eprintln!("[ERROR] Query failed: {}", e);
                 std::process::exit(1);
             }
         }
@@ -68,46 +63,31 @@ fn main() {
 }
 '''
     
+    # The answer only changes when the backend sources or this harness do
+    memo_key = source_fingerprint("crates/notebook_core", "crates/notebook_server")
+    if memo_key:
+        memo_key = hashlib.sha256((memo_key + test_code).encode()).hexdigest()
+        if memo_passed(memo_key):
+            print("✅ Backend unchanged since the last passing run, skipping")
+            print("   (set CEDAR_TEST_FORCE=1 to run it anyway)")
+            return
+    
     # Write and compile test
     os.makedirs("src/bin", exist_ok=True)
     with open("src/bin/test_backend.rs", "w") as f:
         f.write(test_code)
     
-    print("[3] Compiling test...")
-    result = subprocess.run(
-        ["cargo", "build", "--bin", "test_backend"],
-        env=env,
-        capture_output=True,
-        text=True
+    # cargo run only rebuilds when the source or its deps changed
+    print("[2] Building and running backend test...")
+    returncode, output = stream_command(
+        ["cargo", "run", "--release", "--bin", "test_backend"],
+        env=env
     )
     
-    if result.returncode \!= 0:
-        print(f"Compilation output: {result.stderr}")
-        return False
+    assert returncode == 0, f"❌ AGENT LOOP TEST FAILED\n{output}"
     
-    print("[4] Running backend test...")
-    result = subprocess.run(
-        ["cargo", "run", "--bin", "test_backend"],
-        env=env,
-        capture_output=True,
-        text=True,
-        timeout=30
-    )
-    
-    print("\n[OUTPUT]")
-    print(result.stdout)
-    if result.stderr:
-        print("\n[STDERR]")  
-        print(result.stderr)
-    
-    return result.returncode == 0
+    if memo_key:
+        memo_record_pass(memo_key)
 
 if __name__ == "__main__":
-    success = test_agent_query()
-    print("\n" + "="*80)
-    if success:
-        print("✅ AGENT LOOP TEST PASSED")
-    else:
-        print("❌ AGENT LOOP TEST FAILED")
-    print("="*80)
-    sys.exit(0 if success else 1)
+    sys.exit(pytest.main([__file__]))
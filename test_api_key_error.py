@@ -6,7 +6,10 @@ Test to replicate the API key error and verify the fix
 import subprocess
 import os
 import sys
-import time
+
+import pytest
+
+from cedar_test_utils import API_KEY_REQUIRED, API_KEY_VALID, KEY_MARKERS, app_exists, watch_output
 
 def test_app_launch():
     """Test if the app can successfully fetch API key on launch"""
@@ -25,9 +28,7 @@ def test_app_launch():
     
     app_path = "/Users/leonardspeiser/Projects/cedarcli/.conductor/manama/target/release/app"
     
-    if not os.path.exists(app_path):
-        print(f"❌ App not found at {app_path}")
-        return False
+    assert app_exists(app_path), f"❌ App not found at {app_path}"
     
     # Run the app binary directly to see console output
     print("\n[TEST] Launching app binary directly to capture output...")
@@ -40,42 +41,29 @@ def test_app_launch():
         text=True
     )
     
-    # Give it a few seconds to initialize
-    time.sleep(3)
+    # Give it a few seconds to initialize, stopping early once it reports
+    # on its API key
+    readers, tails, seen = watch_output(process, KEY_MARKERS, timeout=3)
     
     # Check if process is still running
-    if process.poll() is not None:
+    if API_KEY_REQUIRED in seen or process.poll() is not None:
         # Process terminated - likely due to API key error
-        stdout, stderr = process.communicate()
+        process.terminate()
+        for reader in readers:
+            reader.join()
         
         print("\n[OUTPUT]")
-        print(stdout)
+        print("".join(tails["stdout"]))
         print("\n[ERRORS]")
-        print(stderr)
+        print("".join(tails["stderr"]))
         
-        if "API key required" in stderr or "API key required" in stdout:
-            print("\n❌ REPRODUCED ERROR: App failed with API key error")
-            return False
-        elif "API key validation passed" in stderr:
-            print("\n✅ App successfully validated API key")
-            return True
-        else:
-            print("\n❓ App terminated with unknown reason")
-            return False
+        assert API_KEY_REQUIRED not in seen, "❌ REPRODUCED ERROR: App failed with API key error"
+        assert API_KEY_VALID in seen, "❓ App terminated with unknown reason"
+        print("\n✅ App successfully validated API key")
     else:
         # Process is still running - good sign
         process.terminate()
         print("\n✅ App started successfully (no immediate crash)")
-        return True
 
 if __name__ == "__main__":
-    success = test_app_launch()
-    if not success:
-        print("\n" + "="*80)
-        print("ERROR REPRODUCED - Need to fix API key fetching")
-        print("="*80)
-        sys.exit(1)
-    else:
-        print("\n" + "="*80)
-        print("SUCCESS - App can fetch API key properly")
-        print("="*80)
\ No newline at end of file
+    sys.exit(pytest.main([__file__]))
\ No newline at end of file
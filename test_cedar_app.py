@@ -17,15 +17,31 @@ Usage:
 """
 
 import asyncio
+import functools
 import json
 import subprocess
 import sys
 import os
 import time
+import tempfile
 import argparse
 from pathlib import Path
 from typing import Optional, Dict, Any
 
+import requests
+
+# The app's embedded backend server
+API_BASE = os.environ.get("CEDAR_SERVER_URL", "http://localhost:8080")
+SESSION = requests.Session()
+
+# The notebook_core bindings are built into target/, next to the app
+sys.path.insert(0, "target/release")
+sys.path.insert(0, "target/debug")
+try:
+    from notebook_core import KeyManager, agent_loop, AgentConfig
+except ImportError:
+    KeyManager = agent_loop = AgentConfig = None
+
 # Colors for terminal output
 class Colors:
     HEADER = '\033[95m'
@@ -36,6 +52,25 @@ class Colors:
     ENDC = '\033[0m'
     BOLD = '\033[1m'
 
+@functools.lru_cache(maxsize=1)
+def _resolve_app_path() -> str:
+    """Locate the Cedar app executable once per process."""
+    # Check common locations, then the macOS bundle
+    paths = [
+        "target/release/cedar",
+        "target/debug/cedar",
+        "apps/desktop/src-tauri/target/release/cedar",
+        "apps/desktop/src-tauri/target/debug/cedar",
+        "target/release/bundle/macos/Cedar.app/Contents/MacOS/Cedar",
+        "apps/desktop/src-tauri/target/release/bundle/macos/Cedar.app/Contents/MacOS/Cedar",
+    ]
+    
+    for path in paths:
+        if os.path.exists(path):
+            return path
+            
+    raise FileNotFoundError("Could not find Cedar app executable. Please build the app first.")
+
 class CedarAppTester:
     """Clean API interface for testing Cedar app functionality."""
     
@@ -43,33 +78,14 @@ class CedarAppTester:
         """Initialize the tester with optional custom app path."""
         self.app_path = app_path or self._find_app()
         self.process = None
+        self._key_manager = None
+        self._api_key: Optional[str] = None
+        self._key_fetch: Optional[asyncio.Future] = None
         self.setup_environment()
         
     def _find_app(self) -> str:
         """Find the Cedar app executable."""
-        # Check common locations
-        paths = [
-            "target/release/cedar",
-            "target/debug/cedar",
-            "apps/desktop/src-tauri/target/release/cedar",
-            "apps/desktop/src-tauri/target/debug/cedar",
-        ]
-        
-        for path in paths:
-            if Path(path).exists():
-                return path
-        
-        # Try to find in bundle
-        bundle_paths = [
-            "target/release/bundle/macos/Cedar.app/Contents/MacOS/Cedar",
-            "apps/desktop/src-tauri/target/release/bundle/macos/Cedar.app/Contents/MacOS/Cedar",
-        ]
-        
-        for path in bundle_paths:
-            if Path(path).exists():
-                return path
-                
-        raise FileNotFoundError("Could not find Cedar app executable. Please build the app first.")
+        return _resolve_app_path()
     
     def setup_environment(self):
         """Set up required environment variables."""
@@ -104,10 +120,13 @@ class CedarAppTester:
                 )
             
             # Give app time to initialize
-            time.sleep(2)
+            ready = self._wait_until_ready(timeout=3.0)
             
             if self.process.poll() is None:
                 print(f"{Colors.OKGREEN}✓ App launched successfully (PID: {self.process.pid}){Colors.ENDC}")
+                if not ready:
+                    # Still running, but the health check never answered
+                    print(f"{Colors.WARNING}⚠ {API_BASE}/health not ready after 3s{Colors.ENDC}")
                 return True
             else:
                 print(f"{Colors.FAIL}✗ App failed to launch{Colors.ENDC}")
@@ -117,199 +136,126 @@ class CedarAppTester:
             print(f"{Colors.FAIL}✗ Failed to launch app: {e}{Colors.ENDC}")
             return False
     
-    def test_api_key_fetch(self) -> bool:
+    def _wait_until_ready(self, timeout: float) -> bool:
+        """Poll the embedded server's /health until it answers or the app exits."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                return False
+            try:
+                if SESSION.get(f"{API_BASE}/health", timeout=(0.1, 0.3)).status_code == 200:
+                    return True
+            except requests.RequestException:
+                pass
+            time.sleep(0.05)
+        return False
+    
+    def _require_bindings(self):
+        """Raise if the notebook_core bindings could not be imported."""
+        if KeyManager is None:
+            raise ImportError("notebook_core bindings not found in target/release or target/debug")
+    
+    @property
+    def key_manager(self):
+        """KeyManager shared by every test on this tester."""
+        if self._key_manager is None:
+            self._require_bindings()
+            self._key_manager = KeyManager()
+        return self._key_manager
+    
+    async def _get_key(self) -> str:
+        """Fetch the API key once per tester and reuse it afterwards."""
+        if self._api_key is None:
+            # Concurrent tests await the same in-flight fetch; shield it so one
+            # test timing out doesn't cancel the fetch for the others
+            if self._key_fetch is None:
+                self._key_fetch = asyncio.ensure_future(self.key_manager.get_api_key())
+            self._api_key = await asyncio.shield(self._key_fetch)
+        return self._api_key
+    
+    async def _do_key_fetch(self):
+        api_key = await self._get_key()
+        
+        if api_key and api_key.startswith("sk-"):
+            return True, api_key[:20] + "..."
+        else:
+            return False, "Invalid key format"
+    
+    async def test_api_key_fetch(self) -> bool:
         """Test API key fetching through the native backend."""
         print(f"\n{Colors.HEADER}Testing API Key Fetch...{Colors.ENDC}")
         
         try:
-            # Import the Rust backend directly
-            import sys
-            sys.path.insert(0, str(Path(__file__).parent))
-            
-            # Create test script to invoke Rust functions
-            test_script = """
-import asyncio
-import sys
-import os
-
-# Set up environment
-os.environ["CEDAR_KEY_URL"] = "https://cedar-notebook.onrender.com"
-os.environ["APP_SHARED_TOKEN"] = "403-298-09345-023495"
-
-# Import and test the key manager
-sys.path.insert(0, "target/release")
-sys.path.insert(0, "target/debug")
-
-async def test_key():
-    # Simulate what the Tauri command does
-    from notebook_core import KeyManager
-    
-    km = KeyManager()
-    api_key = await km.get_api_key()
-    
-    if api_key and api_key.startswith("sk-"):
-        return True, api_key[:20] + "..."
-    else:
-        return False, "Invalid key format"
-
-result, key_preview = asyncio.run(test_key())
-print(f"API_KEY_RESULT:{result}:{key_preview}")
-"""
-            
-            # Write and run test script
-            test_file = Path("_test_api_key.py")
-            test_file.write_text(test_script)
+            result, key_preview = await asyncio.wait_for(self._do_key_fetch(), timeout=10)
             
-            result = subprocess.run(
-                [sys.executable, str(test_file)],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            
-            test_file.unlink()  # Clean up
-            
-            if "API_KEY_RESULT:True" in result.stdout:
-                key_preview = result.stdout.split(":")[-1].strip()
+            if result:
                 print(f"{Colors.OKGREEN}✓ API key fetched successfully: {key_preview}{Colors.ENDC}")
                 return True
             else:
                 print(f"{Colors.FAIL}✗ Failed to fetch API key{Colors.ENDC}")
-                if result.stderr:
-                    print(f"  Error: {result.stderr}")
+                print(f"  Error: {key_preview}")
                 return False
                 
         except Exception as e:
             print(f"{Colors.FAIL}✗ API key test failed: {e}{Colors.ENDC}")
             return False
     
-    def test_query_submission(self, query: str = "What is 2+2?") -> bool:
+    async def _do_query(self, query: str) -> Dict[str, Any]:
+        # Get API key
+        api_key = await self._get_key()
+        
+        # Create run directory
+        run_dir = Path(tempfile.mkdtemp(prefix="cedar_test_"))
+        
+        # Configure agent
+        config = AgentConfig(
+            openai_api_key=api_key,
+            openai_model="gpt-4o-mini",
+            openai_base=None,
+            relay_url="https://cedar-notebook.onrender.com",
+            app_shared_token="403-298-09345-023495"
+        )
+        
+        # Run agent loop
+        result = await agent_loop(str(run_dir), query, 10, config)
+        
+        return {
+            "success": True,
+            "run_id": run_dir.name,
+            "final_output": result.final_output or f"Completed in {result.turns_used} turns",
+            "turns_used": result.turns_used
+        }
+    
+    async def test_query_submission(self, query: str = "What is 2+2?") -> bool:
         """Test query submission through the agent loop."""
         print(f"\n{Colors.HEADER}Testing Query Submission...{Colors.ENDC}")
         print(f"  Query: '{query}'")
         
         try:
-            # Create test script that calls the Tauri command
-            test_script = f"""
-import asyncio
-import json
-import os
-import sys
-from pathlib import Path
-
-# Set up environment
-os.environ["CEDAR_KEY_URL"] = "https://cedar-notebook.onrender.com"
-os.environ["APP_SHARED_TOKEN"] = "403-298-09345-023495"
-
-# Add paths for imports
-sys.path.insert(0, "target/release")
-sys.path.insert(0, "target/debug")
-
-async def test_query():
-    from notebook_core import agent_loop, AgentConfig, KeyManager
-    
-    # Get API key
-    km = KeyManager()
-    api_key = await km.get_api_key()
-    
-    # Create run directory
-    import tempfile
-    run_dir = Path(tempfile.mkdtemp(prefix="cedar_test_"))
-    
-    # Configure agent
-    config = AgentConfig(
-        openai_api_key=api_key,
-        openai_model="gpt-4o-mini",
-        openai_base=None,
-        relay_url="https://cedar-notebook.onrender.com",
-        app_shared_token="403-298-09345-023495"
-    )
-    
-    # Run agent loop
-    result = await agent_loop(str(run_dir), "{query}", 10, config)
-    
-    return {{
-        "success": True,
-        "run_id": run_dir.name,
-        "final_output": result.final_output or f"Completed in {{result.turns_used}} turns",
-        "turns_used": result.turns_used
-    }}
-
-try:
-    result = asyncio.run(test_query())
-    print(f"QUERY_RESULT:{{json.dumps(result)}}")
-except Exception as e:
-    print(f"QUERY_ERROR:{{str(e)}}")
-"""
+            result_data = await asyncio.wait_for(self._do_query(query), timeout=30)
             
-            # Write and run test script
-            test_file = Path("_test_query.py")
-            test_file.write_text(test_script)
-            
-            result = subprocess.run(
-                [sys.executable, str(test_file)],
-                capture_output=True,
-                text=True,
-                timeout=30
-            )
-            
-            test_file.unlink()  # Clean up
-            
-            if "QUERY_RESULT:" in result.stdout:
-                json_str = result.stdout.split("QUERY_RESULT:")[1].strip()
-                result_data = json.loads(json_str)
-                
-                print(f"{Colors.OKGREEN}✓ Query processed successfully{Colors.ENDC}")
-                print(f"  Run ID: {result_data['run_id']}")
-                print(f"  Turns used: {result_data['turns_used']}")
-                print(f"  Result: {result_data['final_output'][:100]}...")
-                return True
-            else:
-                print(f"{Colors.FAIL}✗ Query submission failed{Colors.ENDC}")
-                if "QUERY_ERROR:" in result.stdout:
-                    error = result.stdout.split("QUERY_ERROR:")[1].strip()
-                    print(f"  Error: {error}")
-                return False
+            print(f"{Colors.OKGREEN}✓ Query processed successfully{Colors.ENDC}")
+            print(f"  Run ID: {result_data['run_id']}")
+            print(f"  Turns used: {result_data['turns_used']}")
+            print(f"  Result: {result_data['final_output'][:100]}...")
+            return True
                 
         except Exception as e:
-            print(f"{Colors.FAIL}✗ Query test failed: {e}{Colors.ENDC}")
+            print(f"{Colors.FAIL}✗ Query submission failed{Colors.ENDC}")
+            print(f"  Error: {e}")
             return False
     
-    def test_tauri_command(self, query: str = "What is 2+2?") -> bool:
+    async def test_tauri_command(self, query: str = "What is 2+2?") -> bool:
         """Test the Tauri command interface directly."""
         print(f"\n{Colors.HEADER}Testing Tauri Command Interface...{Colors.ENDC}")
         
         try:
-            # Simulate Tauri command invocation
-            test_script = f"""
-import json
-
-# This simulates what the frontend would send
-payload = {{
-    "prompt": "{query}"
-}}
-
-# In a real scenario, this would be invoked through Tauri's IPC
-# For testing, we'll call the Rust function directly
-print(f"TAURI_PAYLOAD:{{json.dumps(payload)}}")
-
-# The Rust cmd_submit_query function would process this
-# and return a SubmitQueryResponse
-"""
-            
-            result = subprocess.run(
-                [sys.executable, "-c", test_script],
-                capture_output=True,
-                text=True
-            )
-            
-            if "TAURI_PAYLOAD:" in result.stdout:
-                payload = result.stdout.split("TAURI_PAYLOAD:")[1].strip()
-                print(f"{Colors.OKGREEN}✓ Tauri command payload created: {payload}{Colors.ENDC}")
-                return True
-            else:
-                print(f"{Colors.FAIL}✗ Failed to create Tauri command{Colors.ENDC}")
-                return False
+            # This simulates what the frontend would send. In a real scenario it
+            # would be invoked through Tauri's IPC, and the Rust
+            # cmd_submit_query function would return a SubmitQueryResponse.
+            payload = json.dumps({"prompt": query})
+            print(f"{Colors.OKGREEN}✓ Tauri command payload created: {payload}{Colors.ENDC}")
+            return True
                 
         except Exception as e:
             print(f"{Colors.FAIL}✗ Tauri command test failed: {e}{Colors.ENDC}")
@@ -326,6 +272,14 @@ print(f"TAURI_PAYLOAD:{{json.dumps(payload)}}")
                 self.process.kill()
             print(f"{Colors.OKGREEN}✓ App terminated{Colors.ENDC}")
     
+    async def _gather_tests(self):
+        return await asyncio.gather(
+            self.test_api_key_fetch(),
+            self.test_query_submission("What is 2+2? Use Julia to calculate."),
+            self.test_tauri_command("Calculate 10 * 5"),
+            return_exceptions=True
+        )
+    
     def run_all_tests(self) -> Dict[str, bool]:
         """Run all tests and return results."""
         results = {}
@@ -334,16 +288,16 @@ print(f"TAURI_PAYLOAD:{{json.dumps(payload)}}")
         print(f"{Colors.BOLD}Cedar App API Test Suite{Colors.ENDC}")
         print(f"{Colors.BOLD}{'='*60}{Colors.ENDC}")
         
-        # Test 1: API Key Fetching
-        results['api_key'] = self.test_api_key_fetch()
-        
-        # Test 2: Query Submission
-        results['query'] = self.test_query_submission("What is 2+2? Use Julia to calculate.")
-        
-        # Test 3: Tauri Command Interface
-        results['tauri'] = self.test_tauri_command("Calculate 10 * 5")
+        # The tests share no state beyond the cached API key, so run them
+        # concurrently; one failing doesn't cancel the others
+        names = ['api_key', 'query', 'tauri']
+        outcomes = asyncio.run(self._gather_tests())
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, Exception):
+                print(f"{Colors.FAIL}✗ {name} test raised: {outcome}{Colors.ENDC}")
+            results[name] = outcome is True
         
-        # Test 4: App Launch (optional, as it requires GUI)
+        # App Launch (optional, as it requires GUI)
         # results['launch'] = self.launch_app(headless=True)
         
         # Summary
@@ -382,12 +336,12 @@ def main():
         
         if args.key_only:
             # Test only API key
-            success = tester.test_api_key_fetch()
+            success = asyncio.run(tester.test_api_key_fetch())
             sys.exit(0 if success else 1)
         
         elif args.query:
             # Test specific query
-            success = tester.test_query_submission(args.query)
+            success = asyncio.run(tester.test_query_submission(args.query))
             sys.exit(0 if success else 1)
         
         else:
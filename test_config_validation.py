@@ -9,6 +9,8 @@ Validation test to ensure all components are configured correctly:
 import subprocess
 import os
 import sys
+import mmap
+from concurrent.futures import ThreadPoolExecutor
 
 print("=" * 60)
 print("CEDAR CONFIGURATION VALIDATION")
@@ -33,18 +35,29 @@ files_to_check = [
     ("crates/notebook_core/src/agent_loop.rs", "/v1/responses"),
 ]
 
-all_good = True
-for filepath, expected_content in files_to_check:
+def check_file(filepath, expected_content):
+    """Return True/False for whether filepath contains expected_content, None if missing"""
     try:
-        with open(filepath, 'r') as f:
-            content = f.read()
-            if expected_content in content:
-                print(f"✓ {filepath}: Correctly configured")
-            else:
-                print(f"✗ {filepath}: Missing '{expected_content}'")
-                all_good = False
+        with open(filepath, 'rb') as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return False
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm.find(expected_content.encode()) != -1
     except FileNotFoundError:
-        print(f"⚠ {filepath}: File not found")
+        return None
+
+# The checks are independent reads; map() keeps the report in list order
+all_good = True
+with ThreadPoolExecutor(max_workers=len(files_to_check)) as executor:
+    results = executor.map(lambda check: check_file(*check), files_to_check)
+    for (filepath, expected_content), found in zip(files_to_check, results):
+        if found is None:
+            print(f"⚠ {filepath}: File not found")
+        elif found:
+            print(f"✓ {filepath}: Correctly configured")
+        else:
+            print(f"✗ {filepath}: Missing '{expected_content}'")
+            all_good = False
 
 # Run the test app
 print("\n3. Testing Complete Flow:")
@@ -4,10 +4,29 @@ Complete test showing the actual agent loop flow with the UPDATED prompt
 that ALWAYS uses Julia for calculations
 """
 
-import requests
 import json
 import subprocess
-import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cedar_test_utils import (
+    cached_api_key, encode_chat_request, estimate_tokens, julia_command, make_session, openai_limiter,
+    predict_julia_output, run_julia_cached
+)
+
+# orjson parses much faster; fall back to the stdlib when it's absent.
+try:
+    import orjson
+
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
+# One pooled session so the OpenAI and Render TLS connections are reused
+# across calls
+SESSION = make_session(pool_maxsize=16)
+
+# Runs the speculative follow-up request while Julia works out the real result
+SPECULATION = ThreadPoolExecutor(max_workers=1)
 
 print("\n" + "="*80)
 print("CEDAR AGENT LOOP - COMPLETE EXECUTION WITH UPDATED PROMPT")
@@ -16,9 +35,14 @@ print("="*80)
 
 # Step 1: Get API key
 print("\n[BACKEND LOG] Fetching API key from cedar-notebook.onrender.com")
-headers = {"x-app-token": "403-298-09345-023495"}
-response = requests.get("https://cedar-notebook.onrender.com/v1/key", headers=headers, timeout=10)
-api_key = response.json()["openai_api_key"]
+APP_TOKEN = "403-298-09345-023495"
+
+def fetch_api_key():
+    headers = {"x-app-token": APP_TOKEN}
+    response = SESSION.get("https://cedar-notebook.onrender.com/v1/key", headers=headers, timeout=10)
+    return response.json()["openai_api_key"]
+
+api_key = cached_api_key(fetch_api_key, "cedar-notebook.onrender.com", APP_TOKEN)
 print(f"[BACKEND LOG] Got API key: {api_key[:15]}...{api_key[-4:]}")
 
 # Step 2: System prompt (UPDATED from llm_protocol.rs)
@@ -54,52 +78,91 @@ llm_request = {
         {"role": "user", "content": "2+2="}
     ],
     "response_format": {"type": "json_object"},
-    "temperature": 0.1
+    "temperature": 0.1,
+    "max_tokens": 1024
 }
 
-response = requests.post(
+openai_limiter().acquire(estimate_tokens(llm_request))
+response = SESSION.post(
     "https://api.openai.com/v1/chat/completions",
     headers={
         "Authorization": f"Bearer {api_key}",
         "Content-Type": "application/json"
     },
-    json=llm_request,
-    timeout=30
+    data=encode_chat_request(llm_request),
+    # (connect, read)
+    timeout=(5, 30)
 )
 
-llm_response = response.json()
+llm_response = json_loads(response.content)
 choice = llm_response["choices"][0]["message"]["content"]
-decision = json.loads(choice)
+decision = json_loads(choice)
 
 print(f"\n[BACKEND LOG] LLM Decision: {decision['action']}")
 if decision['action'] == 'run_julia':
     print(f"[BACKEND LOG] Julia code to execute: {decision['args']['code']}")
     print(f"\n[USER FACING] {decision['args'].get('user_message', 'Calculating...')}")
     
+    julia_code = decision['args']['code']
+    
+    def request_final_decision(output):
+        """Send a tool result back to the LLM and parse its next decision"""
+        messages = llm_request["messages"] + [
+            {"role": "assistant", "content": choice},
+            {"role": "user", "content": f"Tool result: {output}"}
+        ]
+        
+        second_request = {
+            "model": "gpt-4o-mini",
+            "messages": messages,
+            "response_format": {"type": "json_object"},
+            "temperature": 0.1,
+            "max_tokens": 256
+        }
+        openai_limiter().acquire(estimate_tokens(second_request))
+        second_response = SESSION.post(
+            "https://api.openai.com/v1/chat/completions",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            data=encode_chat_request(second_request),
+            timeout=(5, 30)
+        )
+        
+        final_response = json_loads(second_response.content)
+        final_choice = final_response["choices"][0]["message"]["content"]
+        return json_loads(final_choice)
+    
+    # Pure arithmetic is predictable: send the follow-up with the predicted
+    # result now and keep its answer if Julia agrees
+    predicted = predict_julia_output(julia_code)
+    speculative = None
+    if predicted is not None:
+        predicted = predicted.strip()
+        print(f"[BACKEND LOG] Sending follow-up early with predicted result: {predicted}")
+        speculative = SPECULATION.submit(request_final_decision, predicted)
+    
     # Step 4: Execute Julia
     print("\n[BACKEND LOG] Executing Julia code")
-    julia_code = decision['args']['code']
     
     try:
-        # Create a temp file for Julia code
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.jl', delete=False) as f:
-            f.write(julia_code)
-            julia_file = f.name
+        # Pass the code inline; one-shot snippets don't benefit from optimization
+        def run_julia(code, timeout):
+            return subprocess.run(
+                julia_command("--compile=min", "-O0", "-e", code),
+                capture_output=True,
+                text=True,
+                timeout=timeout
+            )
         
-        result = subprocess.run(
-            ["julia", julia_file],
-            capture_output=True,
-            text=True,
-            timeout=5
-        )
+        # A repeat of an earlier deterministic snippet reuses its stored output
+        result = run_julia_cached(julia_code, timeout=5, run=run_julia)
         
         output = result.stdout.strip() if result.stdout else ""
         print(f"[BACKEND LOG] Julia output: {output}")
         print(f"\n[USER FACING] Julia Result: {output}")
         
-        os.unlink(julia_file)
-        
     except FileNotFoundError:
         print("[BACKEND LOG] Julia not found, simulating execution")
         output = "4"
@@ -107,31 +170,14 @@ if decision['action'] == 'run_julia':
         print(f"\n[USER FACING] Result: {output}")
     
     # Step 5: Send result back to LLM for final response
-    print("\n[BACKEND LOG] Sending execution result back to LLM")
-    
-    messages = llm_request["messages"] + [
-        {"role": "assistant", "content": choice},
-        {"role": "user", "content": f"Tool result: {output}"}
-    ]
-    
-    second_response = requests.post(
-        "https://api.openai.com/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": "gpt-4o-mini",
-            "messages": messages,
-            "response_format": {"type": "json_object"},
-            "temperature": 0.1
-        },
-        timeout=30
-    )
-    
-    final_response = second_response.json()
-    final_choice = final_response["choices"][0]["message"]["content"]
-    final_decision = json.loads(final_choice)
+    if speculative is not None and output == predicted:
+        print("\n[BACKEND LOG] Julia output matched the prediction, using the early follow-up")
+        final_decision = speculative.result()
+    else:
+        if speculative is not None:
+            speculative.cancel()
+        print("\n[BACKEND LOG] Sending execution result back to LLM")
+        final_decision = request_final_decision(output)
     
     print(f"[BACKEND LOG] Final LLM decision: {final_decision['action']}")
     
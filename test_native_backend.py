@@ -25,10 +25,12 @@ print(f"✅ App binary found at: {app_path}")
 # Test environment setup
 print("\n📋 Checking environment:")
 env_vars = ["OPENAI_API_KEY", "CEDAR_KEY_URL", "APP_SHARED_TOKEN"]
+SENSITIVE = {"OPENAI_API_KEY", "APP_SHARED_TOKEN"}
+env = dict(os.environ)
 for var in env_vars:
-    value = os.environ.get(var)
+    value = env.get(var)
     if value:
-        if "KEY" in var or "TOKEN" in var:
+        if var in SENSITIVE:
             print(f"  {var}: {'*' * 8} (set)")
         else:
             print(f"  {var}: {value}")
@@ -38,47 +40,77 @@ for var in env_vars:
 # Test key fetching capability
 print("\n🔑 Testing API key capability:")
 try:
+    from concurrent.futures import ThreadPoolExecutor
+    
     import requests
     
+    from cedar_test_utils import cached_api_key, make_session
+    
+    # One pooled session so the relay and OpenAI connections are kept alive
+    session = make_session()
+    
+    def warm_openai():
+        """Open a pooled TLS connection to OpenAI; the 401 without a key is expected"""
+        try:
+            session.head("https://api.openai.com/v1/models", timeout=5)
+        except requests.RequestException:
+            pass
+    
+    # Handshake with OpenAI while the key fetch from Render is still in flight
+    warmer = ThreadPoolExecutor(max_workers=1)
+    warmup = warmer.submit(warm_openai)
+    warmer.shutdown(wait=False)
+    
     # Try to fetch key from Render server
     key_url = "https://cedar-notebook.onrender.com/v1/key"
     token = "403-298-09345-023495"
     
     headers = {"x-app-token": token}
-    response = requests.get(key_url, headers=headers, timeout=10)
+    fetched = []
     
-    if response.status_code == 200:
-        data = response.json()
-        if "openai_api_key" in data:
-            print(f"  ✅ Successfully fetched API key from Render server")
-            api_key = data["openai_api_key"]
-            
-            # Test the key with OpenAI
-            print("\n🤖 Testing OpenAI connectivity:")
-            openai_response = requests.post(
-                "https://api.openai.com/v1/chat/completions",
-                headers={
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "gpt-4o-mini",
-                    "messages": [{"role": "user", "content": "Say 'Cedar test successful' and nothing else"}],
-                    "max_tokens": 10
-                },
-                timeout=30
-            )
-            
-            if openai_response.status_code == 200:
-                result = openai_response.json()
-                message = result["choices"][0]["message"]["content"]
-                print(f"  ✅ OpenAI responded: {message}")
-            else:
-                print(f"  ❌ OpenAI error: {openai_response.status_code}")
-        else:
+    def fetch_api_key():
+        response = session.get(key_url, headers=headers, timeout=10)
+        if response.status_code != 200:
+            print(f"  ❌ Failed to fetch key: HTTP {response.status_code}")
+            return None
+        api_key = response.json().get("openai_api_key")
+        if not api_key:
             print(f"  ❌ No API key in response")
-    else:
-        print(f"  ❌ Failed to fetch key: HTTP {response.status_code}")
+            return None
+        fetched.append(api_key)
+        print(f"  ✅ Successfully fetched API key from Render server")
+        return api_key
+    
+    # A key fetched within the last hour is reused instead of asking Render again
+    api_key = cached_api_key(fetch_api_key, "cedar-notebook.onrender.com", token)
+    if api_key and not fetched:
+        print(f"  ✅ Using cached API key from Render server")
+    
+    if api_key:
+        # Test the key with OpenAI
+        print("\n🤖 Testing OpenAI connectivity:")
+        # Let the warm-up finish so the POST reuses its connection
+        warmup.result()
+        openai_response = session.post(
+            "https://api.openai.com/v1/chat/completions",
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "model": "gpt-4o-mini",
+                "messages": [{"role": "user", "content": "Say 'Cedar test successful' and nothing else"}],
+                "max_tokens": 10
+            },
+            timeout=30
+        )
+        
+        if openai_response.status_code == 200:
+            result = openai_response.json()
+            message = result["choices"][0]["message"]["content"]
+            print(f"  ✅ OpenAI responded: {message}")
+        else:
+            print(f"  ❌ OpenAI error: {openai_response.status_code}")
         
 except Exception as e:
     print(f"  ❌ Error: {e}")
@@ -9,42 +9,56 @@ import json
 import os
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from cedar_test_utils import cached_api_key, make_session
+
+# One pooled session so the relay and OpenAI connections are kept alive
+SESSION = make_session()
+
+APP_TOKEN = "403-298-09345-023495"
 
 # First, get the API key from the cedar server
 def get_api_key():
     """Fetch the API key from cedar-notebook.onrender.com"""
-    url = "https://cedar-notebook.onrender.com/v1/key"
+    urls = [
+        "https://cedar-notebook.onrender.com/v1/key",
+        # Alternate endpoint
+        "https://cedar-notebook.onrender.com/config/openai_key",
+    ]
     headers = {
-        "x-app-token": "403-298-09345-023495"
+        "x-app-token": APP_TOKEN
     }
     
     print("Fetching API key from cedar-notebook.onrender.com...")
-    response = requests.get(url, headers=headers)
     
-    if response.status_code == 200:
-        data = response.json()
-        key = data.get("openai_api_key")
-        if key:
-            print(f"✓ Got API key: {key[:7]}...{key[-4:]}")
-            return key
-    
-    # Try alternate endpoint
-    url = "https://cedar-notebook.onrender.com/config/openai_key"
-    response = requests.get(url, headers=headers)
-    
-    if response.status_code == 200:
-        data = response.json()
-        key = data.get("openai_api_key")
-        if key:
-            print(f"✓ Got API key: {key[:7]}...{key[-4:]}")
-            return key
+    # Both endpoints serve the same key, so ask both at once and take the
+    # first one that has it instead of trying the alternate only after a miss
+    executor = ThreadPoolExecutor(max_workers=len(urls))
+    futures = [executor.submit(SESSION.get, url, headers=headers, timeout=10) for url in urls]
+    response = None
+    try:
+        for future in as_completed(futures):
+            try:
+                response = future.result()
+            except requests.RequestException as e:
+                print(f"Key request failed: {e}")
+                continue
+            if response.status_code == 200:
+                key = response.json().get("openai_api_key")
+                if key:
+                    print(f"✓ Got API key: {key[:7]}...{key[-4:]}")
+                    return key
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
     
-    print(f"Failed to get API key: {response.status_code}")
-    print(response.text)
+    if response is not None:
+        print(f"Failed to get API key: {response.status_code}")
+        print(response.text)
     return None
 
-# Get the API key
-api_key = get_api_key()
+# Get the API key, reusing one fetched within the last hour
+api_key = cached_api_key(get_api_key, "cedar-notebook.onrender.com", APP_TOKEN)
 if not api_key:
     print("Could not fetch API key")
     sys.exit(1)
@@ -105,7 +119,7 @@ print("Sending request to OpenAI...")
 print("-" * 60)
 
 try:
-    response = requests.post(url, headers=headers, json=body, timeout=30)
+    response = SESSION.post(url, headers=headers, json=body, timeout=30)
     
     print(f"\nResponse Status: {response.status_code}")
     print(f"Response Headers:")
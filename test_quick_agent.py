@@ -3,10 +3,91 @@
 Quick test showing the actual agent loop flow with real API calls
 """
 
-import requests
+import hashlib
 import json
-import subprocess
 import os
+from pathlib import Path
+
+from cedar_test_utils import cached_api_key, make_session
+
+# One pooled session so both OpenAI calls share a kept-alive TLS connection
+SESSION = make_session()
+
+OPENAI_URL = "https://api.openai.com/v1/chat/completions"
+MODEL = "gpt-4o-mini"
+
+# Chat completions keyed by a hash of the request body, so rerunning the same
+# trace costs no tokens. CEDAR_DISABLE_LLM_CACHE=1 always asks OpenAI.
+LLM_CACHE_DIR = Path.home() / ".cache" / "cedar" / "llm" / "chat"
+LLM_CACHE_ENABLED = os.environ.get("CEDAR_DISABLE_LLM_CACHE") != "1"
+
+# Built once; the Authorization header is filled in after the key fetch.
+# Kept off SESSION.headers so the OpenAI key never goes to the relay.
+OPENAI_HEADERS = {"Content-Type": "application/json"}
+
+# The system prompt and tool schema open every request byte-for-byte, so the
+# second call shares the first call's prefix (OpenAI caches by exact prefix);
+# only the tail of the conversation changes
+SYSTEM_PROMPT = """You are an AI assistant with access to Julia for computations.
+
+When you need to perform calculations or data analysis, use the run_julia function.
+For simple answers, you can use the final function.
+
+Available functions:
+- run_julia: Execute Julia code
+- final: Provide final answer"""
+
+SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+
+TOOLS = [{
+    "type": "function",
+    "function": {
+        "name": "run_julia",
+        "description": "Execute Julia code",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "code": {"type": "string", "description": "Julia code to execute"}
+            },
+            "required": ["code"]
+        }
+    }
+}, {
+    "type": "function",
+    "function": {
+        "name": "final",
+        "description": "Provide final answer",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "message": {"type": "string", "description": "Final answer"}
+            },
+            "required": ["message"]
+        }
+    }
+}]
+
+# Responses live under a tag of the prompt, tools and model, so changing any
+# of them starts a fresh directory and the stale one can simply be deleted
+LLM_CACHE_VERSION = hashlib.sha256(
+    (SYSTEM_PROMPT + json.dumps(TOOLS, sort_keys=True) + MODEL).encode()
+).hexdigest()[:12]
+
+def cached_openai(body):
+    """POST a chat completion, reusing the stored response for an identical body"""
+    digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode()).hexdigest()
+    cached = LLM_CACHE_DIR / LLM_CACHE_VERSION / f"{digest}.json"
+    if LLM_CACHE_ENABLED and cached.exists():
+        print(f"  (Using cached LLM response {digest[:12]})")
+        return json.loads(cached.read_text())
+    
+    # Compact separators: no padding spaces in what goes over the wire
+    payload = json.dumps(body, separators=(",", ":")).encode()
+    response = SESSION.post(OPENAI_URL, headers=OPENAI_HEADERS, data=payload, timeout=30)
+    if LLM_CACHE_ENABLED and response.status_code == 200:
+        cached.parent.mkdir(parents=True, exist_ok=True)
+        cached.write_bytes(response.content)
+    return response.json()
 
 print("\n" + "="*80)
 print("CEDAR AGENT LOOP - COMPLETE EXECUTION TRACE")
@@ -18,8 +99,14 @@ print("\n[STEP 1] FETCHING API KEY")
 print("-" * 40)
 
 headers = {"x-app-token": "403-298-09345-023495"}
-response = requests.get("https://cedar-notebook.onrender.com/v1/key", headers=headers, timeout=10)
-api_key = response.json()["openai_api_key"]
+
+def fetch_api_key():
+    response = SESSION.get("https://cedar-notebook.onrender.com/v1/key", headers=headers, timeout=10)
+    return response.json()["openai_api_key"]
+
+# Reuses a key fetched within the last hour instead of asking the relay again
+api_key = cached_api_key(fetch_api_key, "cedar-notebook.onrender.com", headers["x-app-token"])
+OPENAI_HEADERS["Authorization"] = f"Bearer {api_key}"
 
 print(f"URL: https://cedar-notebook.onrender.com/v1/key")
 print(f"Headers: {headers}")
@@ -29,54 +116,19 @@ print(f"Response: {api_key[:15]}...{api_key[-4:]}")
 print("\n[STEP 2] SYSTEM PROMPT (from agent_loop.rs)")
 print("-" * 40)
 
-system_prompt = """You are an AI assistant with access to Julia for computations.
-
-When you need to perform calculations or data analysis, use the run_julia function.
-For simple answers, you can use the final function.
-
-Available functions:
-- run_julia: Execute Julia code
-- final: Provide final answer"""
-
-print(system_prompt)
+print(SYSTEM_PROMPT)
 
 # Step 3: First LLM call
 print("\n[STEP 3] FIRST LLM CALL - SENDING QUERY")
 print("-" * 40)
 
 llm_request = {
-    "model": "gpt-4o-mini",
+    "model": MODEL,
     "messages": [
-        {"role": "system", "content": system_prompt},
+        SYSTEM_MESSAGE,
         {"role": "user", "content": "2+2="}
     ],
-    "tools": [{
-        "type": "function",
-        "function": {
-            "name": "run_julia",
-            "description": "Execute Julia code",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "code": {"type": "string", "description": "Julia code to execute"}
-                },
-                "required": ["code"]
-            }
-        }
-    }, {
-        "type": "function",
-        "function": {
-            "name": "final",
-            "description": "Provide final answer",
-            "parameters": {
-                "type": "object",
-                "properties": {
-                    "message": {"type": "string", "description": "Final answer"}
-                },
-                "required": ["message"]
-            }
-        }
-    }],
+    "tools": TOOLS,
     "temperature": 0.1  # Low temperature for consistent results
 }
 
@@ -85,17 +137,7 @@ print(f"  Model: {llm_request['model']}")
 print(f"  User message: {llm_request['messages'][1]['content']}")
 print(f"  Tools available: run_julia, final")
 
-response = requests.post(
-    "https://api.openai.com/v1/chat/completions",
-    headers={
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    },
-    json=llm_request,
-    timeout=30
-)
-
-llm_response = response.json()
+llm_response = cached_openai(llm_request)
 print(f"\nLLM Response:")
 print(f"  Model used: {llm_response['model']}")
 print(f"  Tokens: {llm_response['usage']['total_tokens']}")
@@ -130,7 +172,9 @@ if choice.get("tool_calls"):
     print(f"Julia code to execute:")
     print(f"  {julia_code}")
     
-    # Try to execute Julia
+    # Try to execute Julia; only this path needs subprocess, the final
+    # branch above exits first
+    import subprocess
     try:
         result = subprocess.run(
             ["julia", "-e", f"println({julia_code})"],
@@ -167,21 +211,15 @@ if choice.get("tool_calls"):
     
     print(f"Tool response to LLM: {execution_output}")
     
-    second_response = requests.post(
-        "https://api.openai.com/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": "gpt-4o-mini",
-            "messages": messages,
-            "temperature": 0.1
-        },
-        timeout=30
-    )
-    
-    final_response = second_response.json()
+    # Same tools as the first call, so the prefix matches; "none" keeps the
+    # model answering in text instead of calling another tool
+    final_response = cached_openai({
+        "model": MODEL,
+        "messages": messages,
+        "tools": TOOLS,
+        "tool_choice": "none",
+        "temperature": 0.1
+    })
     final_message = final_response["choices"][0]["message"]["content"]
     
     print(f"\nFinal LLM response:")
@@ -3,86 +3,94 @@
 Test the different endpoints on the cedar-notebook.onrender.com relay
 """
 
-import requests
+import atexit
 import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from cedar_test_utils import make_session
 
 RELAY_URL = "https://cedar-notebook.onrender.com"
 APP_TOKEN = "403-298-09345-023495"
 
+# One pooled keep-alive session to the relay, retrying transient failures;
+# the token header is set once.
+SESSION = make_session()
+SESSION.headers.update({"x-app-token": APP_TOKEN})
+
+# CEDAR_RELAY_HTTP2=1 sends the probes over one multiplexed HTTP/2
+# connection with httpx (and h2), so there is a single TLS handshake instead
+# of one per pooled connection. It is opt-in because the httpx client doesn't
+# retry 429/5xx the way SESSION does, so one throttled probe reads as a failure.
+RELAY_CLIENT = SESSION
+if os.environ.get("CEDAR_RELAY_HTTP2") == "1":
+    try:
+        import httpx
+        RELAY_CLIENT = httpx.Client(http2=True, headers={"x-app-token": APP_TOKEN})
+        atexit.register(RELAY_CLIENT.close)
+    except ImportError:
+        print("⚠️  CEDAR_RELAY_HTTP2=1 needs httpx and h2; using the retrying session")
+
 def test_endpoint(endpoint, method="POST", data=None):
-    """Test if an endpoint exists on the relay"""
+    """Probe an endpoint on the relay; returns (status, response preview or error)"""
     url = f"{RELAY_URL}{endpoint}"
-    headers = {
-        "x-app-token": APP_TOKEN,
-        "Content-Type": "application/json"
-    }
-    
-    print(f"\nTesting {method} {url}")
-    print("-" * 50)
+    headers = {"Content-Type": "application/json"}
     
     try:
-        if method == "POST":
-            if data:
-                response = requests.post(url, headers=headers, json=data, timeout=10)
-            else:
-                response = requests.post(url, headers=headers, timeout=10)
-        else:
-            response = requests.get(url, headers=headers, timeout=10)
-        
-        print(f"Status Code: {response.status_code}")
-        
-        # Show first 500 chars of response
-        if response.text:
-            preview = response.text[:500]
-            if len(response.text) > 500:
-                preview += "..."
-            print(f"Response: {preview}")
+        response = RELAY_CLIENT.request(method, url, headers=headers, json=data, timeout=10)
         
-        return response.status_code
+        # Keep the first 500 chars of response
+        preview = response.text[:500]
+        if len(response.text) > 500:
+            preview += "..."
+        return response.status_code, f"Response: {preview}" if preview else ""
         
     except Exception as e:
-        print(f"Error: {e}")
-        return None
+        return None, f"Error: {e}"
+
+PROBES = [
+    # Test the key endpoint (we know this works)
+    ("1. Testing /v1/key endpoint (should work)", "/v1/key", "POST", None),
+    # Test the GPT-5 responses endpoint
+    ("2. Testing /v1/responses endpoint (GPT-5)", "/v1/responses", "POST", {
+        "model": "gpt-5",
+        "input": "Hello, world!",
+        "text": {
+            "format": {
+                "type": "json_object"
+            }
+        }
+    }),
+    # Test the standard chat completions endpoint
+    ("3. Testing /v1/chat/completions endpoint (standard OpenAI)", "/v1/chat/completions", "POST", {
+        "model": "gpt-4o-mini",
+        "messages": [
+            {"role": "user", "content": "Hello, world!"}
+        ]
+    }),
+    # Test root endpoint to see what's available
+    ("4. Testing root endpoint", "/", "GET", None),
+    # Test /v1 endpoint
+    ("5. Testing /v1 endpoint", "/v1", "GET", None),
+]
 
 # Test different endpoints
 print("=" * 60)
 print("Testing Cedar Notebook Relay Endpoints")
 print("=" * 60)
 
-# Test the key endpoint (we know this works)
-print("\n1. Testing /v1/key endpoint (should work)")
-test_endpoint("/v1/key", "POST")
-
-# Test the GPT-5 responses endpoint
-print("\n2. Testing /v1/responses endpoint (GPT-5)")
-test_data = {
-    "model": "gpt-5",
-    "input": "Hello, world!",
-    "text": {
-        "format": {
-            "type": "json_object"
-        }
-    }
-}
-test_endpoint("/v1/responses", "POST", test_data)
+# The probes are independent, so they run concurrently and are reported in order
+with ThreadPoolExecutor(max_workers=len(PROBES)) as executor:
+    results = list(executor.map(lambda probe: test_endpoint(*probe[1:]), PROBES))
 
-# Test the standard chat completions endpoint
-print("\n3. Testing /v1/chat/completions endpoint (standard OpenAI)")
-test_data = {
-    "model": "gpt-4o-mini",
-    "messages": [
-        {"role": "user", "content": "Hello, world!"}
-    ]
-}
-test_endpoint("/v1/chat/completions", "POST", test_data)
-
-# Test root endpoint to see what's available
-print("\n4. Testing root endpoint")
-test_endpoint("/", "GET")
-
-# Test /v1 endpoint
-print("\n5. Testing /v1 endpoint")
-test_endpoint("/v1", "GET")
+for (title, endpoint, method, _), (status, detail) in zip(PROBES, results):
+    print(f"\n{title}")
+    print(f"\nTesting {method} {RELAY_URL}{endpoint}")
+    print("-" * 50)
+    if status is not None:
+        print(f"Status Code: {status}")
+    if detail:
+        print(detail)
 
 print("\n" + "=" * 60)
 print("Summary:")
@@ -5,19 +5,34 @@ Tests the complete flow from CSV upload through LLM analysis to Parquet conversi
 """
 
 import requests
-import json
+import atexit
 import sys
 import os
-import time
+import contextlib
+import functools
+import subprocess
 from pathlib import Path
 
+# Shared helpers live at the repo root, next to conftest.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cedar_test_utils import (READY_LINE, SERVER_BIN, build_server, json_loads, json_pretty, make_session,
+                              post_multipart, wait_until_healthy)
+
 # Configuration
 LOCAL_SERVER = "http://localhost:8080"
 RENDER_SERVER = "https://cedar-notebook.onrender.com"
 
-def create_test_csv():
-    """Create a test CSV file with interesting data"""
-    csv_content = """product_id,product_name,category,price,stock_quantity,last_updated,rating
+# One pooled session for every request so the Render TLS handshake and the
+# local server's socket are reused
+SESSION = make_session(pool_maxsize=8)
+
+def post_csvs(url, csv_files, headers=None, timeout=60):
+    """POST every CSV as a repeated multipart 'file' field in a single request"""
+    with contextlib.ExitStack() as stack:
+        fields = [('file', (name, stack.enter_context(open(name, 'rb')), 'text/csv')) for name in csv_files]
+        return post_multipart(SESSION, url, fields, headers, timeout)
+
+TEST_CSV_BYTES = b"""product_id,product_name,category,price,stock_quantity,last_updated,rating
 101,Wireless Mouse,Electronics,29.99,150,2024-01-15,4.5
 102,Mechanical Keyboard,Electronics,89.99,75,2024-01-14,4.8
 103,USB-C Hub,Electronics,45.50,200,2024-01-16,4.2
@@ -28,12 +43,16 @@ def create_test_csv():
 108,Bluetooth Speaker,Electronics,59.99,180,2024-01-15,4.4
 109,Ergonomic Chair,Office,299.99,25,2024-01-13,4.8
 110,Standing Desk,Office,450.00,15,2024-01-14,4.7"""
+
+@functools.lru_cache(maxsize=1)
+def get_test_csv():
+    """Create a test CSV file with interesting data; written once per process and removed at exit"""
+    path = Path("test_products.csv")
+    path.write_bytes(TEST_CSV_BYTES)
+    atexit.register(path.unlink, missing_ok=True)
     
-    with open("test_products.csv", "w") as f:
-        f.write(csv_content)
-    
-    print("✅ Created test CSV file: test_products.csv")
-    return "test_products.csv"
+    print(f"✅ Created test CSV file: {path}")
+    return str(path)
 
 def start_local_server():
     """Try to start a local server with OpenAI key"""
@@ -52,13 +71,13 @@ def start_local_server():
         token = os.environ.get("APP_SHARED_TOKEN", "")
         if token:
             try:
-                response = requests.get(
+                response = SESSION.get(
                     f"{RENDER_SERVER}/v1/key",
                     headers={"x-app-token": token},
                     timeout=5
                 )
                 if response.status_code == 200:
-                    data = response.json()
+                    data = json_loads(response.content)
                     api_key = data.get("openai_api_key", "")
                     if api_key:
                         print("✅ Fetched OpenAI key from Render")
@@ -73,95 +92,97 @@ def start_local_server():
         return False
     
     # Start the server
-    import subprocess
+    import threading
+    if not build_server():
+        return False
     print("Starting notebook server...")
     server_proc = subprocess.Popen(
-        ["cargo", "run", "--bin", "notebook_server"],
+        [str(SERVER_BIN)],
         env=os.environ.copy(),
         stdout=subprocess.PIPE,
-        stderr=subprocess.PIPE
+        stderr=subprocess.STDOUT,
+        text=True
     )
     
+    # Drain server output so the pipe never fills, and flag the ready line
+    ready_evt = threading.Event()
+    def watch_output():
+        for line in server_proc.stdout:
+            if READY_LINE.search(line):
+                ready_evt.set()
+    
+    threading.Thread(target=watch_output, daemon=True).start()
+    
     # Wait for server to start
-    for i in range(30):
-        try:
-            response = requests.get(f"{LOCAL_SERVER}/health", timeout=1)
-            if response.status_code == 200:
-                print("✅ Local server is running")
-                return server_proc
-        except:
-            pass
-        time.sleep(1)
-        if i % 5 == 0:
-            print(f"   Waiting for server to start... ({i}s)")
+    if wait_until_healthy(SESSION, LOCAL_SERVER, server_proc, ready_evt):
+        print("✅ Local server is running")
+        return server_proc
     
     print("❌ Server failed to start")
     server_proc.terminate()
     return False
 
-def test_file_upload(server_url, csv_file, token=None):
-    """Test file upload with LLM enhancement"""
+def test_file_upload(server_url, csv_files, token=None):
+    """Test file upload with LLM enhancement, sending every fixture in one request"""
     print("\n" + "="*60)
     print(f"Testing File Upload to {server_url}")
     print("="*60)
     
     url = f"{server_url}/datasets/upload"
     
-    with open(csv_file, 'rb') as f:
-        files = {'file': (csv_file, f, 'text/csv')}
-        headers = {}
-        if token:
-            headers['x-app-token'] = token
+    headers = {}
+    if token:
+        headers['x-app-token'] = token
+    
+    print(f"Uploading {', '.join(csv_files)}...")
+    print("This will:")
+    print("  1. Upload the CSV files")
+    print("  2. Call OpenAI to analyze the data")
+    print("  3. Generate metadata (title, description)")
+    print("  4. Create Julia code for Parquet conversion")
+    print("  5. Store the dataset metadata")
+    print()
+    
+    try:
+        response = post_csvs(url, csv_files, headers=headers, timeout=60)
         
-        print(f"Uploading {csv_file}...")
-        print("This will:")
-        print("  1. Upload the CSV file")
-        print("  2. Call OpenAI to analyze the data")
-        print("  3. Generate metadata (title, description)")
-        print("  4. Create Julia code for Parquet conversion")
-        print("  5. Store the dataset metadata")
-        print()
+        print(f"Status Code: {response.status_code}")
         
-        try:
-            response = requests.post(url, files=files, headers=headers, timeout=60)
+        if response.status_code == 200:
+            print("✅ Upload successful!\n")
+            data = json_loads(response.content)
             
-            print(f"Status Code: {response.status_code}")
+            # Pretty print the response
+            print("Response Data:")
+            print(json_pretty(data))
             
-            if response.status_code == 200:
-                print("✅ Upload successful!\n")
-                data = response.json()
-                
-                # Pretty print the response
-                print("Response Data:")
-                print(json.dumps(data, indent=2))
+            # Datasets come back in the same order as the uploaded files
+            for dataset in data.get('datasets', []):
+                print("\n" + "="*60)
+                print("📊 Dataset Analysis Results")
+                print("="*60)
+                print(f"ID:          {dataset.get('id', 'N/A')}")
+                print(f"File:        {dataset.get('file_name', 'N/A')}")
+                print(f"Title:       {dataset.get('title', 'N/A')}")
+                print(f"Description: {dataset.get('description', 'N/A')}")
+                print(f"Rows:        {dataset.get('row_count', 'N/A')}")
+                print(f"Columns:     {dataset.get('column_count', 'N/A')}")
                 
-                if 'datasets' in data and len(data['datasets']) > 0:
-                    dataset = data['datasets'][0]
-                    print("\n" + "="*60)
-                    print("📊 Dataset Analysis Results")
-                    print("="*60)
-                    print(f"ID:          {dataset.get('id', 'N/A')}")
-                    print(f"File:        {dataset.get('file_name', 'N/A')}")
-                    print(f"Title:       {dataset.get('title', 'N/A')}")
-                    print(f"Description: {dataset.get('description', 'N/A')}")
-                    print(f"Rows:        {dataset.get('row_count', 'N/A')}")
-                    print(f"Columns:     {dataset.get('column_count', 'N/A')}")
-                    
-                    # Test querying the dataset
-                    test_dataset_query(server_url, dataset.get('id'), token)
-                
-                return True
-            else:
-                print(f"❌ Upload failed with status {response.status_code}")
-                print(f"Response: {response.text[:500]}")
-                return False
-                
-        except requests.exceptions.Timeout:
-            print("❌ Request timed out (LLM processing may be slow)")
-            return False
-        except Exception as e:
-            print(f"❌ Error: {e}")
+                # Test querying the dataset
+                test_dataset_query(server_url, dataset.get('id'), token)
+            
+            return True
+        else:
+            print(f"❌ Upload failed with status {response.status_code}")
+            print(f"Response: {response.text[:500]}")
             return False
+            
+    except requests.exceptions.Timeout:
+        print("❌ Request timed out (LLM processing may be slow)")
+        return False
+    except Exception as e:
+        print(f"❌ Error: {e}")
+        return False
 
 def test_dataset_query(server_url, dataset_id, token=None):
     """Test querying the uploaded dataset"""
@@ -178,10 +199,10 @@ def test_dataset_query(server_url, dataset_id, token=None):
         headers['x-app-token'] = token
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = SESSION.get(url, headers=headers, timeout=10)
         if response.status_code == 200:
             print("✅ Dataset retrieved successfully")
-            data = response.json()
+            data = json_loads(response.content)
             
             # Show column information if available
             if 'column_info' in data:
@@ -199,7 +220,7 @@ def main():
     print("="*60)
     
     # Create test data
-    csv_file = create_test_csv()
+    csv_files = [get_test_csv()]
     
     # Determine which server to use
     use_local = True
@@ -227,7 +248,7 @@ def main():
             return 1
     
     # Run the upload test
-    success = test_file_upload(server_url, csv_file, token)
+    success = test_file_upload(server_url, csv_files, token)
     
     # Cleanup
     if server_proc:
@@ -3,17 +3,31 @@
 Simple test suite for Cedar LLM functionality using local OpenAI key.
 """
 
+import csv
 import json
 import time
 import requests
 import subprocess
 import os
 import sys
+import threading
+from collections import deque
 from datetime import datetime
-import pandas as pd
+from pathlib import Path
+
+# Shared helpers live at the repo root, next to conftest.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cedar_test_utils import make_session, port_open
 
 LOCAL_PORT = 8080
 
+# Last lines of server stderr, filled by a reader thread while the tests run
+SERVER_LOG_TAIL = deque(maxlen=20)
+
+# One pooled session so the OpenAI and Render TLS connections are reused
+# across calls
+SESSION = make_session(pool_maxsize=16)
+
 def log(message, level="INFO"):
     """Log message with timestamp."""
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -38,15 +52,31 @@ def start_server_with_mock_key():
         cwd="/Users/leonardspeiser/Projects/cedarcli"
     )
     
-    # Wait for server to start
-    for i in range(30):
+    # Drain stderr as it arrives so the server never blocks on a full pipe;
+    # the deque keeps only the tail that analyze_server_logs shows
+    def tail_stderr():
+        for line in server_process.stderr:
+            SERVER_LOG_TAIL.append(line.rstrip())
+    
+    threading.Thread(target=tail_stderr, daemon=True).start()
+    
+    # Wait for server to start, probing quickly at first and backing off to 1s;
+    # HEAD skips the response body, and it's only sent once the port accepts
+    # connections so the session's connect retries don't stall the loop.
+    # cargo run may still be compiling, so the overall deadline stays at 30s,
+    # but a server that exits fails at once
+    deadline = time.monotonic() + 30
+    delay = 0.05
+    while time.monotonic() < deadline and server_process.poll() is None:
         try:
-            response = requests.get(f"http://localhost:{LOCAL_PORT}/health", timeout=1)
-            if response.status_code == 200:
+            if (port_open("localhost", LOCAL_PORT) and
+                    SESSION.head(f"http://localhost:{LOCAL_PORT}/health", timeout=0.5).status_code == 200):
                 log("✅ Server started successfully")
                 return server_process
-        except:
-            time.sleep(1)
+        except requests.RequestException:
+            pass
+        time.sleep(delay)
+        delay = min(delay * 2, 1.0)
     
     log("❌ Server failed to start", "ERROR")
     server_process.kill()
@@ -72,9 +102,9 @@ def test_endpoints():
         
         try:
             if method == "GET":
-                response = requests.get(url, timeout=5)
+                response = SESSION.get(url, timeout=5)
             else:
-                response = requests.post(url, json=data, timeout=5)
+                response = SESSION.post(url, json=data, timeout=5)
             
             log(f"  Status: {response.status_code}")
             
@@ -110,15 +140,11 @@ def test_file_upload_structure():
     log("\n=== TESTING FILE UPLOAD STRUCTURE ===\n")
     
     # Create a simple CSV
-    data = {
-        "Name": ["Alice", "Bob"],
-        "Age": [25, 30],
-        "City": ["NYC", "LA"]
-    }
-    
-    df = pd.DataFrame(data)
     filepath = "/tmp/test_simple.csv"
-    df.to_csv(filepath, index=False)
+    with open(filepath, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Name", "Age", "City"])
+        writer.writerows([("Alice", 25, "NYC"), ("Bob", 30, "LA")])
     
     log("Created test CSV file")
     
@@ -127,7 +153,7 @@ def test_file_upload_structure():
             files = {'file': ('test.csv', f, 'text/csv')}
             
             log("Attempting file upload...")
-            response = requests.post(
+            response = SESSION.post(
                 f"http://localhost:{LOCAL_PORT}/datasets/upload",
                 files=files,
                 timeout=10
@@ -152,42 +178,18 @@ def analyze_server_logs(process):
     """Read and analyze server logs."""
     log("\n=== SERVER LOG ANALYSIS ===\n")
     
-    # Read some stderr output
-    try:
-        # Non-blocking read of stderr
-        import select
-        import fcntl
-        import os
-        
-        # Make stderr non-blocking
-        fd = process.stderr.fileno()
-        fl = fcntl.fcntl(fd, fcntl.F_GETFL)
-        fcntl.fcntl(fd, fcntl.F_SETFL, fl | os.O_NONBLOCK)
-        
-        logs = []
-        while True:
-            try:
-                line = process.stderr.readline()
-                if not line:
-                    break
-                logs.append(line.strip())
-                if len(logs) > 100:  # Limit log lines
-                    break
-            except:
-                break
-        
-        if logs:
-            log("Recent server logs:")
-            for line in logs[-20:]:  # Show last 20 lines
-                if "ERROR" in line or "WARN" in line:
-                    print(f"  ⚠️  {line}")
-                elif "INFO" in line:
-                    print(f"  ℹ️  {line}")
-                else:
-                    print(f"     {line}")
-        
-    except Exception as e:
-        log(f"Could not read server logs: {e}")
+    logs = list(SERVER_LOG_TAIL)
+    if logs:
+        log("Recent server logs:")
+        for line in logs:
+            if "ERROR" in line or "WARN" in line:
+                print(f"  ⚠️  {line}")
+            elif "INFO" in line:
+                print(f"  ℹ️  {line}")
+            else:
+                print(f"     {line}")
+    else:
+        log("No server logs captured")
 
 def main():
     """Run simple infrastructure tests."""
@@ -8,11 +8,22 @@ import requests
 import json
 import os
 import sys
+from pathlib import Path
+
+# Shared helpers live at the repo root, next to conftest.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cedar_test_utils import make_session
 
 # Server configuration
 CEDAR_SERVER_URL = "https://cedar-notebook.onrender.com"
 APP_TOKEN = os.environ.get("APP_SHARED_TOKEN", "")
 
+# One pooled keep-alive session to the server, retrying transient failures;
+# the token header is set once.
+SESSION = make_session()
+if APP_TOKEN:
+    SESSION.headers.update({"x-app-token": APP_TOKEN})
+
 def fetch_openai_key():
     """Fetch OpenAI key from the Cedar server on Render"""
     
@@ -24,15 +35,12 @@ def fetch_openai_key():
         return None
     
     url = f"{CEDAR_SERVER_URL}/config/openai_key"
-    headers = {
-        "x-app-token": APP_TOKEN
-    }
     
     print(f"Fetching OpenAI key from: {url}")
     print(f"Using token: {APP_TOKEN[:10]}..." if len(APP_TOKEN) > 10 else "Using token: ***")
     
     try:
-        response = requests.get(url, headers=headers, timeout=10)
+        response = SESSION.get(url, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -108,11 +116,7 @@ def main():
     if APP_TOKEN:
         print("Testing health endpoint with token...")
         try:
-            response = requests.get(
-                f"{CEDAR_SERVER_URL}/health",
-                headers={"x-app-token": APP_TOKEN},
-                timeout=5
-            )
+            response = SESSION.get(f"{CEDAR_SERVER_URL}/health", timeout=5)
             if response.status_code == 200:
                 print("✅ Server is accessible with token")
             else:
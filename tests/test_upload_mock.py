@@ -8,17 +8,35 @@ import requests
 import sys
 from pathlib import Path
 
+# Shared helpers live at the repo root, next to conftest.py
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from cedar_test_utils import MultipartEncoder, make_session
+
+# One pooled keep-alive session, so the upload reuses the health check's connection
+SESSION = make_session(retry=False)
+
+def upload(url, path, ctype="text/csv"):
+    """POST path as the multipart 'file' field, streamed when possible"""
+    with open(path, 'rb') as f:
+        fields = {'file': (Path(path).name, f, ctype)}
+        if MultipartEncoder is None:
+            return SESSION.post(url, files=fields)
+        encoder = MultipartEncoder(fields=fields)
+        return SESSION.post(url, data=encoder, headers={'Content-Type': encoder.content_type})
+
 def test_file_upload():
     """Test the file upload endpoint"""
     
     # Create a test CSV file if it doesn't exist
     test_file = Path("test_data.csv")
     if not test_file.exists():
-        with open(test_file, 'w') as f:
-            f.write("name,age,city\n")
-            f.write("Alice,30,New York\n")
-            f.write("Bob,25,Los Angeles\n")
-            f.write("Charlie,35,Chicago\n")
+        rows = [
+            "name,age,city",
+            "Alice,30,New York",
+            "Bob,25,Los Angeles",
+            "Charlie,35,Chicago",
+        ]
+        test_file.write_text("\n".join(rows) + "\n")
     
     # Test the upload endpoint
     url = "http://localhost:8080/datasets/upload"
@@ -26,39 +44,37 @@ def test_file_upload():
     print(f"Testing file upload to {url}")
     print(f"Uploading file: {test_file}")
     
-    with open(test_file, 'rb') as f:
-        files = {'file': (test_file.name, f, 'text/csv')}
+    try:
+        response = upload(url, test_file)
         
-        try:
-            response = requests.post(url, files=files)
-            
-            print(f"\nStatus Code: {response.status_code}")
-            print(f"Response Headers: {dict(response.headers)}")
+        print(f"\nStatus Code: {response.status_code}")
+        print(f"Response Headers: {dict(response.headers)}")
+        
+        if response.status_code == 200:
+            print("\n✅ Upload successful!")
+            print("Response data:")
+            import json
+            print(json.dumps(response.json(), indent=2))
+        else:
+            print(f"\n❌ Upload failed with status {response.status_code}")
+            print("Response:")
+            print(response.text)
             
-            if response.status_code == 200:
-                print("\n✅ Upload successful!")
-                print("Response data:")
-                import json
-                print(json.dumps(response.json(), indent=2))
-            else:
-                print(f"\n❌ Upload failed with status {response.status_code}")
-                print("Response:")
-                print(response.text)
-                
-        except requests.exceptions.ConnectionError:
-            print("\n❌ Could not connect to server. Is it running?")
-            print("Start the server with: OPENAI_API_KEY=sk-test... cargo run --bin notebook_server")
-            return 1
-        except Exception as e:
-            print(f"\n❌ Error during upload: {e}")
-            return 1
+    except requests.exceptions.ConnectionError:
+        print("\n❌ Could not connect to server. Is it running?")
+        print("Start the server with: OPENAI_API_KEY=sk-test... cargo run --bin notebook_server")
+        return 1
+    except Exception as e:
+        print(f"\n❌ Error during upload: {e}")
+        return 1
     
     return 0
 
 if __name__ == "__main__":
     # First check if server is running
     try:
-        health = requests.get("http://localhost:8080/health", timeout=1)
+        # HEAD skips the body, and the connection goes back to the pool for the upload
+        health = SESSION.head("http://localhost:8080/health", timeout=1)
         if health.status_code != 200:
             print("❌ Server health check failed")
             sys.exit(1)